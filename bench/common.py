@@ -0,0 +1,198 @@
+"""Shared helpers for the pi-deployer benchmarks.
+
+Scripts in bench/ are run directly (``python bench/<script>.py``) and import
+this module as ``common``; it also puts the repository root on sys.path so
+the deployer modules can be imported.
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from verify import verify_signature  # noqa: E402
+
+SECRET = "bench-secret"
+REPO = "bench/app"
+TOKEN = "bench-token"
+
+
+def signed_push(secret=SECRET, repo=REPO, branch="main", commits=1):
+    """Build a synthetic GitHub push payload for a fresh commit.
+
+    Returns:
+        (body bytes, headers dict) signed the way GitHub signs webhooks.
+    """
+    sha = uuid.uuid4().hex + uuid.uuid4().hex[:8]
+    files = [f"src/file{i}.py" for i in range(commits)]
+    body = json.dumps({
+        "ref": f"refs/heads/{branch}",
+        "after": sha,
+        "repository": {"name": repo.split("/")[-1], "full_name": repo},
+        "head_commit": {
+            "id": sha,
+            "message": "bench commit",
+            "author": {"name": "bench"},
+            "url": f"https://github.com/{repo}/commit/{sha}",
+        },
+        "commits": [
+            {"id": sha, "added": [], "removed": [], "modified": [path]} for path in files
+        ],
+    }).encode()
+    signature = "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    assert verify_signature(body, signature, secret)
+    return body, {
+        "Content-Type": "application/json",
+        "X-GitHub-Event": "push",
+        "X-GitHub-Delivery": str(uuid.uuid4()),
+        "X-Hub-Signature-256": signature,
+    }
+
+
+def write_config(directory, projects=1):
+    """Write a projects.yml whose deploys run a no-op script."""
+    script = os.path.join(directory, "noop.sh")
+    with open(script, "w") as f:
+        f.write("true\n")
+    config = os.path.join(directory, "projects.yml")
+    with open(config, "w") as f:
+        f.write("projects:\n")
+        for i in range(projects):
+            suffix = "" if i == 0 else str(i)
+            f.write(
+                f"  - name: bench{suffix}\n"
+                f"    repo: {REPO}{suffix}\n"
+                f"    path: {directory}\n"
+                f"    deploy_script: {script}\n"
+                f"    webhook_secret: {SECRET}\n"
+            )
+    return config
+
+
+def start_deployer(directory, config, server="waitress", **env_overrides):
+    """Start deployer.py in a subprocess; returns (process, base URL)."""
+    port = free_port()
+    env = dict(
+        os.environ,
+        SERVER=server,
+        FLASK_HOST="127.0.0.1",
+        FLASK_PORT=str(port),
+        PROJECTS_CONFIG=config,
+        DEPLOY_TOKEN=TOKEN,
+        STATE_DIR=os.path.join(directory, f"state-{server}-{port}"),
+        LOG_DIR=os.path.join(directory, f"logs-{server}-{port}"),
+        TELEGRAM_BOT_TOKEN="",
+        CONFIG_WATCH="false",
+        **env_overrides,
+    )
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "deployer.py")],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"{base}/health", timeout=1)
+            return proc, base
+        except requests.RequestException:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError(f"{server} server did not start on port {port}")
+
+
+def stop_deployer(proc):
+    proc.terminate()
+    try:
+        proc.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+def run_load(request, total, concurrency):
+    """Call request(session, i) total times from concurrency client threads.
+
+    request returns True on success. Each client keeps one keep-alive session.
+    """
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    cursor = iter(range(total))
+
+    def client():
+        nonlocal errors
+        session = requests.Session()
+        for i in cursor:
+            start = time.perf_counter()
+            try:
+                ok = request(session, i)
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                errors += not ok
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return summarize(latencies, time.perf_counter() - start, errors)
+
+
+def summarize(latencies, wall=None, errors=0):
+    """Throughput and latency percentiles (milliseconds) of a list of seconds."""
+    values = sorted(v * 1000 for v in latencies)
+    if not values:
+        return {"count": 0, "errors": errors}
+    return {
+        "count": len(values),
+        "rps": len(values) / wall if wall else None,
+        "mean": statistics.fmean(values),
+        "p50": percentile(values, 50),
+        "p90": percentile(values, 90),
+        "p99": percentile(values, 99),
+        "max": values[-1],
+        "errors": errors,
+    }
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def print_table(rows, label="name"):
+    """Print summaries as an aligned table: rows is [(label, summary), ...]."""
+    width = max([16] + [len(name) for name, _ in rows])
+    print(f"{label:<{width}} {'count':>6} {'req/s':>8} {'p50 ms':>9} {'p90 ms':>9} "
+          f"{'p99 ms':>9} {'max ms':>9} {'errors':>6}")
+    for name, s in rows:
+        if not s["count"]:
+            print(f"{name:<{width}} {0:>6}")
+            continue
+        rps = f"{s['rps']:.0f}" if s.get("rps") else "-"
+        print(f"{name:<{width}} {s['count']:>6} {rps:>8} {s['p50']:>9.2f} {s['p90']:>9.2f} "
+              f"{s['p99']:>9.2f} {s['max']:>9.2f} {s['errors']:>6}")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
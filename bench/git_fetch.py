@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""Fetch / fast-forward cost of run_deploy against a local bare-repo remote.
+
+Builds a bare repository with some history, clones it as the project's
+checkout, then repeatedly pushes a new commit to the bare repo and deploys
+it (pull-only mode, real git, no network). Each mode gets a fresh clone:
+
+    cold        the deploy fetches after --queue-delay, as without prefetch
+    prefetch    a prefetch starts when the "webhook" arrives, the deploy
+                runs after --queue-delay
+    maintained  like prefetch, on a checkout that had repo maintenance
+                (commit-graph, gc) run first
+
+Reports total deploy time and the fetch / update stage times.
+
+Usage:
+    python bench/git_fetch.py [--iterations 20] [--history 500] [--files 20]
+        [--file-kb 16] [--queue-delay 0.5] [--modes cold,prefetch,maintained]
+"""
+
+import argparse
+import os
+import subprocess
+import tempfile
+import time
+
+from common import print_table, summarize
+
+MODES = ("cold", "prefetch", "maintained")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--history", type=int, default=500,
+                        help="commits in the remote before measuring")
+    parser.add_argument("--files", type=int, default=20, help="files changed per commit")
+    parser.add_argument("--file-kb", type=int, default=16, help="size of each changed file")
+    parser.add_argument("--queue-delay", type=float, default=0.5,
+                        help="seconds between the push and the deploy starting")
+    parser.add_argument("--modes", default=",".join(MODES))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="pi-deployer-bench-") as tmp:
+        os.environ.update({
+            "LOG_DIR": os.path.join(tmp, "logs"),
+            "STATE_DIR": os.path.join(tmp, "state"),
+            "TELEGRAM_BOT_TOKEN": "",
+        })
+        # Imported after the environment is set
+        import gitops
+        from deploy import run_deploy
+
+        remote = os.path.join(tmp, "remote.git")
+        writer = os.path.join(tmp, "writer")
+        _git("init", "--quiet", "--bare", "-b", "main", remote)
+        _git("clone", "--quiet", remote, writer)
+        for i in range(args.history):
+            _commit(writer, i, args.files, args.file_kb)
+        _git("-C", writer, "push", "--quiet", "origin", "main")
+
+        rows, stage_rows = [], []
+        for mode in args.modes.split(","):
+            if mode not in MODES:
+                raise SystemExit(f"Unknown mode {mode!r}; choose from {', '.join(MODES)}")
+            checkout = os.path.join(tmp, f"checkout-{mode}")
+            _git("clone", "--quiet", "-b", "main", remote, checkout)
+            project = {
+                "name": f"bench-{mode}",
+                "repo": f"bench/{mode}",
+                "path": checkout,
+                "branch": "main",
+                "deploy_mode": "pull-only",
+                "timeout": 120,
+            }
+            if mode == "maintained":
+                gitops.RepoMaintainer(lambda: [project], lambda: True).run(project)
+
+            durations, stages = [], {}
+            for i in range(args.iterations):
+                sha = _commit(writer, args.history + i, args.files, args.file_kb)
+                _git("-C", writer, "push", "--quiet", "origin", "main")
+                commit = {"sha": sha, "message": f"bench {i}", "author": "bench"}
+                if mode != "cold":
+                    gitops.prefetch(project, sha)
+                time.sleep(args.queue_delay)
+                start = time.perf_counter()
+                result = run_deploy(project, commit)
+                durations.append(time.perf_counter() - start)
+                if not result["success"]:
+                    raise SystemExit(f"{mode} deploy failed:\n{result['output']}")
+                for s in result["stages"]:
+                    stages.setdefault(s["name"], []).append(s["duration"])
+            rows.append((mode, summarize(durations)))
+            stage_rows += [(f"{mode}:{name}", summarize(stages[name]))
+                           for name in ("fetch", "update") if name in stages]
+
+    print_table(rows, label="mode")
+    print()
+    print_table(stage_rows, label="stage")
+    print(f"\ngit: {gitops.stats()}")
+
+
+def _commit(repo, i, files, file_kb):
+    for n in range(files):
+        with open(os.path.join(repo, f"file{n}.txt"), "wb") as f:
+            f.write(os.urandom(file_kb * 512).hex().encode())
+    _git("-C", repo, "add", "-A")
+    _git("-C", repo, "-c", "user.name=bench", "-c", "user.email=bench@localhost",
+         "commit", "--quiet", "-m", f"commit {i}")
+    return _git("-C", repo, "rev-parse", "HEAD").strip()
+
+
+def _git(*args):
+    return subprocess.run(["git", *args], check=True, capture_output=True, text=True).stdout
+
+
+if __name__ == "__main__":
+    main()
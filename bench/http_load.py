@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""Load-test the deployer's HTTP endpoints.
+
+Starts deployer.py with a throwaway config, optionally seeds deploy
+history and logs, then drives each selected endpoint with concurrent
+keep-alive clients and prints throughput and latency percentiles.
+
+Endpoints:
+    deploy   POST /deploy with signed synthetic push payloads (fresh commits)
+    bad-sig  POST /deploy with an invalid signature (rejection cost)
+    status   GET /status
+    logs     GET /logs/bench (Bearer)
+    config   GET /config
+    config304  GET /config with If-None-Match (cached 304 path)
+    metrics  GET /metrics
+
+Usage:
+    python bench/http_load.py [--endpoints status,config] [--requests 2000]
+        [--concurrency 16] [--server waitress] [--projects 10]
+"""
+
+import argparse
+import tempfile
+import time
+
+import requests
+
+from common import (
+    TOKEN,
+    print_table,
+    run_load,
+    signed_push,
+    start_deployer,
+    stop_deployer,
+    write_config,
+)
+
+ENDPOINTS = ("deploy", "bad-sig", "status", "logs", "config", "config304", "metrics")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS))
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--server", default="waitress")
+    parser.add_argument("--projects", type=int, default=1,
+                        help="projects in the generated config")
+    parser.add_argument("--seed-deploys", type=int, default=20,
+                        help="deploys run before measuring, to fill logs and history")
+    args = parser.parse_args()
+
+    rows = []
+    with tempfile.TemporaryDirectory(prefix="pi-deployer-bench-") as tmp:
+        config = write_config(tmp, projects=args.projects)
+        proc, base = start_deployer(tmp, config, server=args.server)
+        try:
+            _seed(base, args.seed_deploys)
+            for name in args.endpoints.split(","):
+                request = _make_request(name, base, args.requests)
+                rows.append((name, run_load(request, args.requests, args.concurrency)))
+        finally:
+            stop_deployer(proc)
+    print_table(rows, label="endpoint")
+
+
+def _seed(base, count):
+    """Run a few real deploys so /logs and /status have content."""
+    auth = {"Authorization": f"Bearer {TOKEN}"}
+    for _ in range(count):
+        requests.post(f"{base}/deploy/bench?force=1", headers=auth, timeout=10)
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            state = requests.get(f"{base}/status", timeout=10).json()["projects"][0]
+            if not state.get("deploying") and not state.get("queued"):
+                break
+            time.sleep(0.02)
+
+
+def _make_request(name, base, total):
+    auth = {"Authorization": f"Bearer {TOKEN}"}
+    if name == "deploy":
+        payloads = [signed_push() for _ in range(total)]
+        return lambda s, i: s.post(f"{base}/deploy", data=payloads[i][0],
+                                   headers=payloads[i][1], timeout=30).status_code == 202
+    if name == "bad-sig":
+        body, headers = signed_push()
+        headers = dict(headers, **{"X-Hub-Signature-256": "sha256=" + "0" * 64})
+        return lambda s, i: s.post(f"{base}/deploy", data=body, headers=headers,
+                                   timeout=30).status_code == 401
+    if name == "status":
+        return lambda s, i: s.get(f"{base}/status", timeout=30).ok
+    if name == "logs":
+        return lambda s, i: s.get(f"{base}/logs/bench?limit=200", headers=auth,
+                                  timeout=30).ok
+    if name == "config":
+        return lambda s, i: s.get(f"{base}/config", timeout=30).ok
+    if name == "config304":
+        etag = requests.get(f"{base}/config", timeout=30).headers.get("ETag", "")
+        return lambda s, i: s.get(f"{base}/config", headers={"If-None-Match": etag},
+                                  timeout=30).status_code == 304
+    if name == "metrics":
+        return lambda s, i: s.get(f"{base}/metrics", timeout=30).ok
+    raise SystemExit(f"Unknown endpoint {name!r}; choose from {', '.join(ENDPOINTS)}")
+
+
+if __name__ == "__main__":
+    main()
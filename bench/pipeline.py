@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""End-to-end run_deploy benchmark with local stand-ins.
+
+Runs deploy.run_deploy in-process against fake ``git``, ``docker``,
+``systemctl`` and ``sudo`` executables (shell scripts on PATH that sleep for
+a configurable time and print a little output) and a local HTTP server that
+plays both the Telegram Bot API and the project's health endpoint. The fake
+docker also stands in for a registry: in docker-image mode every
+iteration starts without the image, so it is "pulled" each time. Nothing
+touches the network, real repositories or containers, so the numbers show
+the deployer's own overhead plus the simulated command times.
+
+Usage:
+    python bench/pipeline.py [--iterations 20] [--modes pull-only,docker-image]
+        (modes are deploy_mode values, plus "swap" for docker-compose with
+        compose_strategy: swap)
+        [--git-delay 0.05] [--docker-delay 0.2] [--systemctl-delay 0.05]
+        [--output-lines 200]
+"""
+
+import argparse
+import json
+import os
+import stat
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from common import print_table, summarize
+
+FAKE_SHA = "0123456789abcdef0123456789abcdef01234567"
+
+_FAKE_GIT = """#!/bin/sh
+# Fake git: answers the subcommands run_deploy uses
+while [ "$1" = "-C" ]; do shift 2; done
+case "$1" in
+  rev-parse) echo "{sha}" ;;
+  diff) echo "src/app.py" ;;
+  *) sleep "${{BENCH_GIT_DELAY:-0}}" ;;
+esac
+"""
+
+_FAKE_DOCKER = """#!/bin/sh
+# Fake docker: prints build-like output for compose commands; an image
+# counts as present once a pull ran
+case "$*" in
+  *" images "*) echo "[]" ;;
+  "image inspect"*) test -e "$BENCH_IMAGE_STATE" ;;
+  *)
+    case "$*" in *" pull "*) touch "$BENCH_IMAGE_STATE" ;; esac
+    i=0
+    while [ "$i" -lt "${BENCH_OUTPUT_LINES:-0}" ]; do
+      echo "#$i [internal] step $i/$BENCH_OUTPUT_LINES done"
+      i=$((i + 1))
+    done
+    sleep "${BENCH_DOCKER_DELAY:-0}"
+    ;;
+esac
+"""
+
+_FAKE_SYSTEMCTL = """#!/bin/sh
+sleep "${BENCH_SYSTEMCTL_DELAY:-0}"
+"""
+
+_FAKE_SUDO = """#!/bin/sh
+exec "$@"
+"""
+
+
+class _FakeServer(BaseHTTPRequestHandler):
+    """Telegram Bot API (POST /bot<token>/<method>) and health endpoint (GET)."""
+
+    telegram_calls = 0
+    health_calls = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        with self.lock:
+            type(self).health_calls += 1
+        self._reply({"status": "ok"})
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with self.lock:
+            type(self).telegram_calls += 1
+        self._reply({"ok": True, "result": {"message_id": 1}})
+
+    def _reply(self, body):
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--modes", default="pull-only,docker-compose,swap,docker-image,systemd")
+    parser.add_argument("--git-delay", type=float, default=0.05)
+    parser.add_argument("--docker-delay", type=float, default=0.2)
+    parser.add_argument("--systemctl-delay", type=float, default=0.05)
+    parser.add_argument("--output-lines", type=int, default=200,
+                        help="lines printed by each fake docker command")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="pi-deployer-bench-") as tmp:
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _FakeServer)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        _setup_env(tmp, base, args)
+
+        # Imported after the environment points at the stand-ins
+        from deploy import run_deploy
+        from notify import get_dispatcher
+
+        rows, stage_rows = [], []
+        for mode in args.modes.split(","):
+            project = _project(tmp, mode, base)
+            durations, stages = [], {}
+            for i in range(args.iterations):
+                if os.path.exists(os.environ["BENCH_IMAGE_STATE"]):
+                    os.remove(os.environ["BENCH_IMAGE_STATE"])
+                commit = {"sha": FAKE_SHA, "message": f"bench {i}", "author": "bench"}
+                start = time.perf_counter()
+                result = run_deploy(project, commit, force=True)
+                durations.append(time.perf_counter() - start)
+                if not result["success"]:
+                    raise SystemExit(f"{mode} deploy failed:\n{result['output']}")
+                for s in result["stages"]:
+                    stages.setdefault(s["name"], []).append(s["duration"])
+            rows.append((mode, summarize(durations)))
+            stage_rows += [(f"{mode}:{name}", summarize(values))
+                           for name, values in stages.items()]
+
+        dispatcher = get_dispatcher()
+        if dispatcher:
+            dispatcher.flush(timeout=10)
+        server.shutdown()
+
+    print_table(rows, label="mode")
+    print()
+    print_table(stage_rows, label="stage")
+    print(f"\nfake Telegram calls: {_FakeServer.telegram_calls}, "
+          f"health probes: {_FakeServer.health_calls}")
+
+
+def _setup_env(tmp, base, args):
+    bin_dir = os.path.join(tmp, "bin")
+    os.makedirs(bin_dir)
+    for name, script in (("git", _FAKE_GIT.format(sha=FAKE_SHA)), ("docker", _FAKE_DOCKER),
+                         ("systemctl", _FAKE_SYSTEMCTL), ("sudo", _FAKE_SUDO)):
+        path = os.path.join(bin_dir, name)
+        with open(path, "w") as f:
+            f.write(script)
+        os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+
+    os.environ.update({
+        "PATH": bin_dir + os.pathsep + os.environ.get("PATH", ""),
+        "LOG_DIR": os.path.join(tmp, "logs"),
+        "STATE_DIR": os.path.join(tmp, "state"),
+        "TELEGRAM_BOT_TOKEN": "bench",
+        "TELEGRAM_CHAT_ID": "1",
+        "TELEGRAM_API_URL": base,
+        "BENCH_GIT_DELAY": str(args.git_delay),
+        "BENCH_DOCKER_DELAY": str(args.docker_delay),
+        "BENCH_SYSTEMCTL_DELAY": str(args.systemctl_delay),
+        "BENCH_OUTPUT_LINES": str(args.output_lines),
+        "BENCH_IMAGE_STATE": os.path.join(tmp, "image-pulled"),
+    })
+
+
+def _project(tmp, mode, base):
+    path = os.path.join(tmp, f"repo-{mode}")
+    os.makedirs(path, exist_ok=True)
+    project = {
+        "name": f"bench-{mode}",
+        "repo": f"bench/{mode}",
+        "path": path,
+        "branch": "main",
+        "deploy_mode": "docker-compose" if mode == "swap" else mode,
+        "timeout": 60,
+        "health_check": {"enabled": True, "url": f"{base}/health", "retries": 1},
+    }
+    if mode == "swap":
+        project["compose_strategy"] = "swap"
+    if mode == "docker-image":
+        project["images"] = {"app": "registry.local/bench/app:{short_sha}"}
+    return project
+
+
+if __name__ == "__main__":
+    main()
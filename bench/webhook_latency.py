@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""Compare webhook acceptance latency of the serving modes under load.
+
+Starts deployer.py once per server (waitress, Flask dev server) with a
+throwaway config whose deploy is a no-op script, fires signed push
+webhooks from concurrent clients, and prints throughput and latency
+percentiles of the 202 responses.
+
+Usage:
+    python bench/webhook_latency.py [--requests 2000] [--concurrency 16]
+"""
+
+import argparse
+import tempfile
+
+from common import print_table, run_load, signed_push, start_deployer, stop_deployer, write_config
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--servers", default="waitress,flask")
+    args = parser.parse_args()
+
+    rows = []
+    with tempfile.TemporaryDirectory(prefix="pi-deployer-bench-") as tmp:
+        config = write_config(tmp)
+        for server in args.servers.split(","):
+            payloads = [signed_push() for _ in range(args.requests)]
+            proc, base = start_deployer(tmp, config, server=server)
+            try:
+                def post(session, i):
+                    body, headers = payloads[i]
+                    return session.post(f"{base}/deploy", data=body, headers=headers,
+                                        timeout=30).status_code == 202
+                rows.append((server, run_load(post, args.requests, args.concurrency)))
+            finally:
+                stop_deployer(proc)
+    print_table(rows, label="server")
+
+
+if __name__ == "__main__":
+    main()
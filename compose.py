@@ -0,0 +1,266 @@
+"""docker compose deploy actions for pi-deployer."""
+
+import contextlib
+import fnmatch
+import logging
+import os
+import subprocess
+
+import yaml
+
+logger = logging.getLogger("pi-deployer")
+
+# Changes to these files can affect every service, so they force a full restart
+COMPOSE_FILE_PATTERNS = (
+    "docker-compose*.yml",
+    "docker-compose*.yaml",
+    "compose*.yml",
+    "compose*.yaml",
+    ".env",
+)
+
+# File names docker compose looks for when no -f is given, in its order
+DEFAULT_COMPOSE_FILES = ("compose.yaml", "compose.yml", "docker-compose.yaml",
+                         "docker-compose.yml")
+
+IMAGE_MODE = "docker-image"
+
+
+def compose_cmd(project, *args):
+    """Build a docker compose command honouring the project's compose_file.
+
+    In docker-image mode the image override file is added once written.
+    """
+    cmd = ["docker", "compose"]
+    override = image_override_path(project)
+    if project.get("deploy_mode") == IMAGE_MODE and os.path.exists(override):
+        cmd += ["-f", base_compose_file(project), "-f", override]
+    elif project.get("compose_file"):
+        cmd += ["-f", project["compose_file"]]
+    return cmd + list(args)
+
+
+def base_compose_file(project):
+    """The project's compose file, as compose would pick it without -f."""
+    if project.get("compose_file"):
+        return project["compose_file"]
+    for name in DEFAULT_COMPOSE_FILES:
+        if os.path.exists(os.path.join(project["path"], name)):
+            return name
+    return DEFAULT_COMPOSE_FILES[0]
+
+
+def image_override_path(project):
+    state_dir = os.path.abspath(os.environ.get("STATE_DIR", "./state"))
+    return os.path.join(state_dir, f"{project['name']}.images.yml")
+
+
+def resolve_images(project, sha):
+    """Map each service in ``images`` to its image reference for a commit.
+
+    Templates may use ``{sha}``, ``{short_sha}`` (7 characters) and
+    ``{branch}`` (with ``/`` replaced by ``-``), e.g.
+    ``ghcr.io/me/web:{sha}``.
+    """
+    fields = {
+        "sha": sha,
+        "short_sha": sha[:7],
+        "branch": project.get("branch", "main").replace("/", "-"),
+    }
+    images = {}
+    for service, template in (project.get("images") or {}).items():
+        try:
+            images[service] = template.format(**fields)
+        except (KeyError, IndexError, ValueError) as e:
+            raise RuntimeError(f"Invalid image template for {service}: {template!r} ({e})")
+    return images
+
+
+def write_image_override(project, images):
+    """Pin services to images with a compose override file (atomically)."""
+    path = image_override_path(project)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        yaml.safe_dump({"services": {s: {"image": ref} for s, ref in images.items()}}, f)
+    os.replace(tmp, path)
+
+
+def affected_services(project, changed_files):
+    """Map changed paths to the compose services that need a rebuild.
+
+    Uses the project's ``service_paths`` map (service -> list of fnmatch
+    globs, where ``*`` also matches ``/``). Files matching no service are
+    ignored.
+
+    Args:
+        project: Merged project config dict.
+        changed_files: Paths changed between the old and new commit, or None
+            if unknown.
+
+    Returns:
+        Sorted list of services to recreate, or None when the whole stack
+        must be restarted (no map, unknown diff, or compose files changed).
+    """
+    service_paths = project.get("service_paths") or {}
+    if not service_paths or changed_files is None:
+        return None
+
+    compose_patterns = COMPOSE_FILE_PATTERNS + tuple(
+        [project["compose_file"]] if project.get("compose_file") else []
+    )
+    services = set()
+    for path in changed_files:
+        basename = path.rsplit("/", 1)[-1]
+        if any(fnmatch.fnmatch(path, p) or fnmatch.fnmatch(basename, p)
+               for p in compose_patterns):
+            logger.info("Compose file %s changed, restarting full stack", path)
+            return None
+        for service, patterns in service_paths.items():
+            if isinstance(patterns, str):
+                patterns = [patterns]
+            if any(fnmatch.fnmatch(path, p) for p in patterns):
+                services.add(service)
+    return sorted(services)
+
+
+def compose_deploy(project, run, changed_files=None, stage=None):
+    """Run the docker-compose deploy action.
+
+    The ``compose_strategy`` option picks how containers are replaced:
+
+    restart (default): ``down`` then ``up -d``; the stack is offline for the
+        whole build and start.
+    swap: build and pull the new images while the old containers keep
+        serving, then ``up -d --no-build`` so compose only recreates the
+        containers whose image or config changed. Downtime shrinks to
+        container start time.
+
+    Args:
+        project: Merged project config dict.
+        run: Callable(cmd) executing a command in the repo directory.
+        changed_files: Paths changed by this deploy, or None if unknown.
+        stage: Optional callable(name) returning a context manager that
+            times a sub-step ("build", "pull", "start").
+
+    Returns:
+        The services that were recreated, or None for the whole stack.
+    """
+    services = affected_services(project, changed_files)
+    if services == []:
+        return services
+
+    stage = stage or (lambda name: contextlib.nullcontext())
+    if project.get("compose_strategy", "restart") == "swap":
+        with stage("build"):
+            swap_build(project, run, services)
+        with stage("pull"):
+            swap_pull(project, run, services)
+        with stage("start"):
+            swap_start(project, run, services)
+    elif services is None:
+        with stage("start"):
+            run(compose_cmd(project, "down"))
+            run(compose_cmd(project, "up", "-d"))
+    else:
+        with stage("start"):
+            run(compose_cmd(project, "up", "-d", "--no-deps", "--build", *services))
+    return services
+
+
+def swap_build(project, run, services):
+    """swap strategy: build new images while the old containers keep serving."""
+    if services != []:
+        run(compose_cmd(project, "build", *(services or [])))
+
+
+def swap_pull(project, run, services):
+    """swap strategy: pull the images of services that are not built locally."""
+    if services != []:
+        run(compose_cmd(project, "pull", "--ignore-buildable", *(services or [])))
+
+
+def swap_start(project, run, services):
+    """swap strategy: recreate only containers whose image or config changed."""
+    if services != []:
+        no_deps = ["--no-deps"] if services else []
+        run(compose_cmd(project, "up", "-d", "--no-build", *no_deps, *(services or [])))
+
+
+def image_deploy(project, run, sha, env=None, timeout=60, stage=None):
+    """Run the docker-image deploy action: pull prebuilt images, no build.
+
+    Resolves every service's image for sha, pins them with an override
+    file, pulls the ones not already present (compose pulls in parallel;
+    the Docker daemon downloads layers concurrently and skips layers it
+    already has) and starts the stack with ``up -d --no-build``. Images the
+    registry does not have are built locally when ``image_fallback`` is
+    "build" (the default); with "fail" the deploy fails instead.
+
+    Args:
+        project: Merged project config dict.
+        run: Callable(cmd) executing a command in the repo directory.
+        sha: Commit being deployed.
+        stage: Optional callable(name) returning a context manager that
+            times a sub-step ("pull", "build", "start").
+
+    Returns:
+        dict with "cached", "pulled" and "built" lists of services.
+    """
+    if not sha:
+        raise RuntimeError("Could not determine the commit to deploy images for")
+    images = resolve_images(project, sha)
+    if not images:
+        raise RuntimeError("docker-image mode needs an images map (service -> image)")
+    write_image_override(project, images)
+    stage = stage or (lambda name: contextlib.nullcontext())
+
+    cached = [s for s, ref in images.items() if _image_exists(ref, env, timeout)]
+    missing = [s for s in images if s not in cached]
+    if missing:
+        with stage("pull"):
+            run(compose_cmd(project, "pull", "--ignore-pull-failures", *missing))
+    built = [s for s in missing if not _image_exists(images[s], env, timeout)]
+    if built:
+        refs = ", ".join(images[s] for s in built)
+        if project.get("image_fallback", "build") != "build":
+            raise RuntimeError(f"Images not found in registry: {refs}")
+        logger.warning("Images not found in registry, building locally: %s", refs)
+        with stage("build"):
+            run(compose_cmd(project, "build", *built))
+    with stage("start"):
+        run(compose_cmd(project, "up", "-d", "--no-build"))
+    return {
+        "cached": cached,
+        "pulled": [s for s in missing if s not in built],
+        "built": built,
+    }
+
+
+def pull_images(project, run, sha, env=None, timeout=60):
+    """Pull the images of sha that are not present yet, without starting them.
+
+    Lets docker-image mode download while the checkout is still being
+    updated; image_deploy then finds them locally.
+
+    Returns:
+        The services that were pulled.
+    """
+    images = resolve_images(project, sha)
+    missing = [s for s, ref in images.items() if not _image_exists(ref, env, timeout)]
+    if missing:
+        write_image_override(project, images)
+        run(compose_cmd(project, "pull", "--ignore-pull-failures", *missing))
+    return missing
+
+
+def _image_exists(ref, env=None, timeout=60):
+    """Whether the image is present in the local Docker image store."""
+    try:
+        result = subprocess.run(
+            ["docker", "image", "inspect", "--format", "{{.Id}}", ref],
+            capture_output=True, env=env, timeout=timeout,
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+    return result.returncode == 0
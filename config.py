@@ -1,6 +1,8 @@
 """Configuration loading, merging, and hot-reload for pi-deployer."""
 
 import copy
+import hashlib
+import json
 import logging
 import os
 
@@ -8,11 +10,15 @@ import yaml
 
 logger = logging.getLogger("pi-deployer")
 
+# Replaced as a whole on every reload (never mutated in place), so readers
+# that grab it once always see one consistent version
 _config = {
     "defaults": {},
     "projects": [],
     "_projects_by_repo": {},
     "_projects_by_key": {},
+    "_raw_projects": {},
+    "_digest": None,
 }
 
 
@@ -20,37 +26,75 @@ MAX_CONFIG_SIZE = 1 * 1024 * 1024  # 1 MB
 
 
 def load_config(path=None):
-    """Load projects.yml and merge defaults into each project."""
+    """Load projects.yml and merge defaults into each project.
+
+    Projects whose raw entry (and the defaults) did not change keep their
+    previously merged dict; only added or edited projects are merged again.
+    Re-reading an unchanged file is a no-op.
+
+    Returns:
+        dict with "added", "removed" and "changed" project names.
+    """
+    global _config
     config_path = path or os.environ.get("PROJECTS_CONFIG", "./projects.yml")
 
     file_size = os.path.getsize(config_path)
     if file_size > MAX_CONFIG_SIZE:
         raise ValueError(f"Config file too large: {file_size} bytes (max {MAX_CONFIG_SIZE})")
 
-    with open(config_path, "r") as f:
-        raw = yaml.safe_load(f)
+    with open(config_path, "rb") as f:
+        data = f.read()
+    current = _config
+    digest = hashlib.sha256(data).hexdigest()
+    if digest == current["_digest"]:
+        logger.info("Config %s unchanged, nothing to reload", config_path)
+        return {"added": [], "removed": [], "changed": []}
 
+    raw = yaml.safe_load(data) or {}
     defaults = raw.get("defaults", {})
     projects = raw.get("projects", [])
+    defaults_changed = defaults != current["defaults"]
 
     merged_projects = []
     by_repo = {}
     by_key = {}
+    raw_projects = {}
+    changes = {"added": [], "removed": [], "changed": []}
 
     for project in projects:
-        merged = _merge_defaults(defaults, project)
+        name = project.get("name")
+        previous = current["_projects_by_key"].get(name)
+        if previous is not None and not defaults_changed and \
+                current["_raw_projects"].get(name) == project:
+            merged = previous
+        else:
+            merged = _merge_defaults(defaults, project)
+            changes["added" if previous is None else "changed"].append(name)
         merged_projects.append(merged)
+        raw_projects[name] = project
         repo = merged.get("repo", "")
-        by_repo[repo] = merged
+        by_repo.setdefault(repo, []).append(merged)
         by_key[merged["name"]] = merged
 
-    _config["defaults"] = defaults
-    _config["projects"] = merged_projects
-    _config["_projects_by_repo"] = by_repo
-    _config["_projects_by_key"] = by_key
+    changes["removed"] = [n for n in current["_projects_by_key"] if n not in by_key]
+
+    _config = {
+        "defaults": defaults,
+        "projects": merged_projects,
+        "_projects_by_repo": by_repo,
+        "_projects_by_key": by_key,
+        "_raw_projects": raw_projects,
+        "_digest": digest,
+    }
 
-    logger.info("Loaded %d projects from %s", len(merged_projects), config_path)
-    return _config
+    logger.info(
+        "Loaded %d projects from %s (added: %s, removed: %s, changed: %s)",
+        len(merged_projects), config_path,
+        ", ".join(changes["added"]) or "-",
+        ", ".join(changes["removed"]) or "-",
+        ", ".join(changes["changed"]) or "-",
+    )
+    return changes
 
 
 def _merge_defaults(defaults, project):
@@ -64,14 +108,9 @@ def _merge_defaults(defaults, project):
     return result
 
 
-def get_config():
-    """Return the current config dict."""
-    return _config
-
-
-def get_project(full_name):
-    """Find a project by its full repo name (owner/repo)."""
-    return _config["_projects_by_repo"].get(full_name)
+def get_projects_by_repo(full_name):
+    """Find every project deployed from a repo (owner/repo), in config order."""
+    return _config["_projects_by_repo"].get(full_name, [])
 
 
 def find_project_by_key(key):
@@ -84,6 +123,22 @@ def get_all_projects():
     return _config["projects"]
 
 
+def get_masked_config():
+    """Return (JSON text, ETag) of the public config view with secrets masked.
+
+    Computed once per loaded config version and cached on it.
+    """
+    cfg = _config
+    cached = cfg.get("_masked")
+    if cached is None:
+        body = json.dumps(mask_secrets({
+            "defaults": cfg["defaults"],
+            "projects": cfg["projects"],
+        }), sort_keys=True)
+        cached = cfg["_masked"] = (body, hashlib.sha256(body.encode("utf-8")).hexdigest()[:32])
+    return cached
+
+
 def mask_secrets(config_dict):
     """Return a copy of config with sensitive fields masked."""
     secret_keys = {"webhook_secret", "secret", "token", "password"}
@@ -0,0 +1,124 @@
+"""Duplicate webhook delivery detection for pi-deployer.
+
+GitHub redelivers webhooks on timeouts and on manual "Redeliver", so the
+same push can arrive more than once. DeliveryCache remembers recently seen
+keys (X-GitHub-Delivery IDs and repo/commit pairs) in a bounded LRU with a
+TTL, and appends every new key to a journal file so the cache survives a
+restart.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger("pi-deployer")
+
+DEFAULT_MAX_ENTRIES = 1000
+DEFAULT_TTL = 24 * 3600
+
+
+class DeliveryCache:
+    """Bounded LRU/TTL set of seen delivery keys, journaled to disk.
+
+    Args:
+        path: Journal file (one "expires_at key" line per entry), or None to
+            keep the cache in memory only.
+        max_entries: Keys kept before the least recently seen is evicted.
+        ttl: Seconds a key is remembered.
+    """
+
+    def __init__(self, path=None, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        self.path = path
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = float(ttl)
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> expires_at (wall clock)
+        self._lock = threading.Lock()
+        self._journal_lines = 0
+        if path:
+            self._load()
+
+    def check_and_add(self, keys):
+        """Return the first key already seen, or None after remembering all keys."""
+        keys = [k for k in keys if k]
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                expires_at = self._entries.get(key)
+                if expires_at is not None and expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return key
+
+            self.misses += 1
+            expires_at = now + self.ttl
+            for key in keys:
+                self._entries[key] = expires_at
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._append(keys, expires_at)
+            return None
+
+    def discard(self, keys):
+        """Forget keys, so the next delivery carrying them is processed again."""
+        with self._lock:
+            removed = [k for k in keys if k and self._entries.pop(k, None) is not None]
+            if removed and self.path:
+                try:
+                    self._compact()
+                except OSError as e:
+                    logger.warning("Could not write delivery journal %s: %s", self.path, e)
+
+    def stats(self):
+        """Return hit/miss counters and current size for /status."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+    def _load(self):
+        now = time.time()
+        try:
+            with open(self.path, "r") as f:
+                for line in f:
+                    expires_at, _, key = line.rstrip("\n").partition(" ")
+                    try:
+                        expires_at = float(expires_at)
+                    except ValueError:
+                        continue
+                    if key and expires_at > now:
+                        self._entries[key] = expires_at
+                        self._entries.move_to_end(key)
+        except FileNotFoundError:
+            pass
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self._compact()
+
+    def _append(self, keys, expires_at):
+        """Journal new keys (lock held); compact once the file holds mostly stale lines."""
+        if not self.path or not keys:
+            return
+        try:
+            with open(self.path, "a") as f:
+                f.writelines(f"{expires_at} {key}\n" for key in keys)
+            self._journal_lines += len(keys)
+            if self._journal_lines > 2 * self.max_entries:
+                self._compact()
+        except OSError as e:
+            logger.warning("Could not write delivery journal %s: %s", self.path, e)
+
+    def _compact(self):
+        """Rewrite the journal with only the live entries."""
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            f.writelines(f"{expires_at} {key}\n" for key, expires_at in self._entries.items())
+        os.replace(tmp, self.path)
+        self._journal_lines = len(self._entries)
@@ -1,119 +1,501 @@
 """Deployment execution engine for pi-deployer."""
 
+import contextlib
 import logging
 import os
 import subprocess
+import threading
+import time
 from datetime import datetime, timezone
 
-from health import run_health_check
+from compose import (
+    affected_services,
+    compose_deploy,
+    image_deploy,
+    pull_images,
+    swap_build,
+    swap_pull,
+    swap_start,
+)
+from config import get_all_projects
+from gitops import fetch_upstream, is_git_managed, upstream_sha
+from health import run_health_checks
+from logstore import DeployLogWriter, last_deploy
 from notify import send_notification
+from pathfilter import has_path_filters, matching_paths
+from releases import load_release, record_release, rollback
+from runner import CancelToken, OutputTail, ResourceUsage, limit_cmd, stream_cmd
+from stepcache import get_step_cache, hash_inputs, outputs_present
+from stepgraph import DEFAULT_PARALLELISM, build_graph, run_graph
 
 logger = logging.getLogger("pi-deployer")
 
+# Output of deploys that are currently running, keyed by project name
+_live_output = {}
+_live_output_mutex = threading.Lock()
 
-def run_deploy(project, commit_info=None):
+# Callables notified around every pipeline stage (see add_stage_hook)
+_stage_hooks = []
+
+
+def add_stage_hook(hook):
+    """Register a callable notified when a deploy stage starts and ends.
+
+    The hook is called as ``hook(event, project_name, stage, duration, error)``
+    where event is "start" or "end"; duration (seconds) and error (the
+    exception, or None) are only set for "end". Hooks run on the deploy
+    thread, so they must be quick; exceptions they raise are logged and
+    ignored.
+    """
+    _stage_hooks.append(hook)
+
+
+# Callables receiving live deploy events (see add_event_listener)
+_event_listeners = []
+
+
+def add_event_listener(listener):
+    """Register a callable receiving live deploy events as dicts.
+
+    Every event has "type" and "project": "started" (with "deploy_id" and
+    "commit"), "output" (one "line" of command output) and "health" (with
+    "healthy" and per-target "targets"). Listeners run on the deploy
+    thread, so they must not block; exceptions they raise are logged and
+    ignored.
+    """
+    _event_listeners.append(listener)
+
+
+def _emit(event):
+    for listener in list(_event_listeners):
+        try:
+            listener(event)
+        except Exception:
+            logger.exception("Deploy event listener %r failed", listener)
+
+
+def get_live_output(name):
+    """Return the buffered output lines of a running deploy, or None."""
+    with _live_output_mutex:
+        output = _live_output.get(name)
+    return output.tail.lines() if output else None
+
+
+def run_deploy(project, commit_info=None, force=False):
     """Execute the deployment pipeline for a project.
 
+    The pipeline is the project's step graph (see stepgraph): the preset
+    of its deploy mode plus its declared ``steps``, with independent
+    steps running in parallel.
+
     Args:
         project: Merged project config dict.
         commit_info: Optional dict with commit metadata.
+        force: Deploy even if the target commit is already checked out.
 
     Returns:
-        dict with "success" (bool), "output" (str), "duration" (float).
+        dict with "success" (bool), "status" (success, skipped, failed,
+        timeout or rolled-back), "output" (str, tail of the command output),
+        "started_at" (ISO timestamp), "duration" (float), "stages" (list of
+        {"name", "duration"}), "deploy_id" (int, index in the project log),
+        "skipped" (bool, True when nothing had to change), "rolled_back_to"
+        (SHA restored after a failed health check, or None), "resources"
+        (CPU seconds, peak RSS and I/O of the deploy's commands, see
+        runner.ResourceUsage) and "error".
     """
     name = project["name"]
-    repo_dir = project["path"]
-    timeout = project.get("timeout", 300)
-    deploy_script = project.get("deploy_script")
-    deploy_mode = project.get("deploy_mode", "pull-only")
 
     log_dir = os.environ.get("LOG_DIR", "./logs")
     os.makedirs(log_dir, exist_ok=True)
-    log_file = os.path.join(log_dir, f"{name}.log")
-
-    env = _build_env(project, commit_info)
-
-    send_notification("triggered", project, commit_info)
 
     start = datetime.now(timezone.utc)
-    output_lines = []
+    output = _DeployOutput(log_dir, name, limits=project.get("resources"))
+    with _live_output_mutex:
+        _live_output[name] = output
+    stage = _StageTimer(name)
+    pipeline = _Pipeline(project, commit_info, force, output, stage,
+                         previous=last_deploy(log_dir, name))
+    _emit({
+        "type": "started",
+        "project": name,
+        "deploy_id": output.deploy_id,
+        "commit": (commit_info or {}).get("sha"),
+    })
 
     try:
-        # Step 1: git pull (always, unless script-only)
-        if deploy_mode != "script-only" and not deploy_script:
-            result = _run_cmd(
-                ["git", "-C", repo_dir, "pull", "--ff-only"],
-                env=env, timeout=timeout,
-            )
-            output_lines.append(result)
-
-        # Step 2: deploy action
-        if deploy_script:
-            result = _run_cmd(
-                ["bash", deploy_script],
-                env=env, timeout=timeout, cwd=repo_dir,
-            )
-            output_lines.append(result)
-        elif deploy_mode == "docker-compose":
-            result = _run_cmd(
-                ["docker", "compose", "down"],
-                env=env, timeout=timeout, cwd=repo_dir,
-            )
-            output_lines.append(result)
-            result = _run_cmd(
-                ["docker", "compose", "up", "-d"],
-                env=env, timeout=timeout, cwd=repo_dir,
-            )
-            output_lines.append(result)
-        elif deploy_mode == "systemd":
-            service = project.get("service_name", name)
-            result = _run_cmd(
-                ["sudo", "systemctl", "restart", service],
-                env=env, timeout=timeout,
-            )
-            output_lines.append(result)
-        elif deploy_mode == "script-only":
-            script = project.get("deploy_script", "")
-            if script:
-                result = _run_cmd(
-                    ["bash", script],
-                    env=env, timeout=timeout, cwd=repo_dir,
-                )
-                output_lines.append(result)
-        # pull-only: git pull already done above
-
-        # Step 3: health check
-        hc = project.get("health_check", {})
-        if hc.get("enabled") and hc.get("url"):
-            healthy = run_health_check(
-                url=hc["url"],
-                retries=hc.get("retries", 3),
-                interval=hc.get("interval", 5),
-            )
-            if not healthy:
-                raise RuntimeError(f"Health check failed: {hc['url']}")
-            output_lines.append(f"Health check passed: {hc['url']}")
+        try:
+            graph = build_graph(project)
+        except ValueError as e:
+            raise RuntimeError(f"Invalid step graph: {e}")
+        if not is_git_managed(project):
+            send_notification("triggered", project, commit_info)
+        run_graph(graph, pipeline.run_node, cancel=output.cancel.cancel,
+                  max_parallel=int(os.environ.get("STEP_PARALLELISM", DEFAULT_PARALLELISM)))
+        pipeline.write_cache_summary()
 
         duration = (datetime.now(timezone.utc) - start).total_seconds()
-        output = "\n".join(output_lines)
-        _write_log(log_file, name, "success", output, duration)
+        output.close("success", duration)
         send_notification("success", project, commit_info,
                           f"Deployed in {duration:.1f}s")
-        return {"success": True, "output": output, "duration": duration}
+        return _result("success", output, start, duration, stage)
 
-    except subprocess.TimeoutExpired:
+    except _Skipped as e:
         duration = (datetime.now(timezone.utc) - start).total_seconds()
-        output = "\n".join(output_lines)
-        _write_log(log_file, name, "timeout", output, duration)
+        output.write(f"skipped: {e}")
+        output.close("skipped", duration)
+        return _result("skipped", output, start, duration, stage)
+
+    except subprocess.TimeoutExpired as e:
+        duration = (datetime.now(timezone.utc) - start).total_seconds()
+        output.write(f"TIMEOUT: {' '.join(e.cmd)} exceeded {e.timeout}s")
+        output.close("timeout", duration)
         send_notification("timeout", project, commit_info)
-        return {"success": False, "output": output, "duration": duration}
+        return _result("timeout", output, start, duration, stage, error=str(e))
 
     except Exception as e:
         duration = (datetime.now(timezone.utc) - start).total_seconds()
-        output = "\n".join(output_lines) + f"\nERROR: {e}"
-        _write_log(log_file, name, "failed", output, duration)
-        send_notification("failed", project, commit_info, output)
-        return {"success": False, "output": output, "duration": duration}
+        output.write(f"ERROR: {e}")
+        rolled_back_to = pipeline.rolled_back_to
+        status = "rolled-back" if rolled_back_to else "failed"
+        output.close(status, duration)
+        send_notification("failed", project, commit_info, output.tail.text())
+        return _result(status, output, start, duration, stage,
+                       error=str(e), rolled_back_to=rolled_back_to)
+
+    finally:
+        output.close("aborted", (datetime.now(timezone.utc) - start).total_seconds())
+        with _live_output_mutex:
+            if _live_output.get(name) is output:
+                del _live_output[name]
+
+
+class _Skipped(Exception):
+    """Raised by the fetch step when there is nothing to deploy."""
+
+
+class _Pipeline:
+    """State shared by the steps of one deploy, and the built-in actions.
+
+    run_node() runs one graph node as a stage; built-in nodes call the
+    method named after their action.
+    """
+
+    def __init__(self, project, commit_info, force, output, stage, previous=None):
+        self.project = project
+        self.commit_info = commit_info
+        self.force = force
+        self.output = output
+        self.stage = stage
+        self.previous = previous
+        self.repo_dir = project["path"]
+        self.timeout = project.get("timeout", 300)
+        self.env = _build_env(project, commit_info)
+        self.before = None
+        self.deployed_sha = None
+        self.rolled_back_to = None
+        self._services = None
+        self._services_lock = threading.Lock()
+
+    def run_node(self, node):
+        if "run" in node:
+            with self.stage(f"step.{node['name']}") as record:
+                self._run_step(node, record)
+        else:
+            with self.stage(node["name"]):
+                getattr(self, node["action"])()
+
+    def run(self, cmd, cwd=None, prefix=""):
+        _run_cmd(cmd, self.output, env=self.env, timeout=self.timeout, cwd=cwd,
+                 prefix=prefix)
+
+    def run_in_repo(self, cmd):
+        self.run(cmd, cwd=self.repo_dir)
+
+    # Built-in actions
+
+    def fetch(self):
+        """Fetch, and stop the deploy if the target commit is already live
+        or the push changes no file the project cares about."""
+        project, env, timeout = self.project, self.env, self.timeout
+        fetched = fetch_upstream(project, self.run, env=env, timeout=timeout,
+                                 sha=(self.commit_info or {}).get("sha"))
+        if not fetched:
+            self.output.write("Upstream already at the pushed commit (prefetched)")
+        # The project's own release, not HEAD: other projects may share the checkout
+        self.deployed_sha = (load_release(project["name"]) or {}).get("sha")
+        target = _already_deployed(self.repo_dir, self.commit_info, self.previous,
+                                   self.deployed_sha, env, timeout)
+        if target and not self.force:
+            raise _Skipped(f"already deployed ({target[:12]})")
+        if not self.force and _no_matching_changes(project, self.commit_info,
+                                                   self.deployed_sha, env, timeout):
+            raise _Skipped("no changed files match include_paths / ignore_paths")
+        send_notification("triggered", project, self.commit_info)
+
+    def update(self):
+        """Fast-forward to the fetched upstream."""
+        self.before = self.deployed_sha or _git_rev_parse(
+            self.repo_dir, "HEAD", self.env, self.timeout)
+        self.run(["git", "-C", self.repo_dir, "merge", "--ff-only", "@{u}"])
+
+    def script(self):
+        self.run_in_repo(["bash", self.project["deploy_script"]])
+
+    def compose(self):
+        services = compose_deploy(
+            self.project, self.run_in_repo, self._changed_files(),
+            stage=lambda step: self.stage(f"deploy.{step}"),
+        )
+        self._report_services(services)
+
+    def compose_build(self):
+        swap_build(self.project, self.run_in_repo, self._compose_services())
+
+    def compose_pull(self):
+        swap_pull(self.project, self.run_in_repo, self._compose_services())
+
+    def compose_start(self):
+        services = self._compose_services()
+        swap_start(self.project, self.run_in_repo, services)
+        self._report_services(services)
+
+    def image_pull(self):
+        sha = upstream_sha(self.repo_dir, self.env, self.timeout) \
+            if is_git_managed(self.project) else None
+        if sha:
+            pull_images(self.project, self.run_in_repo, sha, env=self.env, timeout=self.timeout)
+
+    def image(self):
+        images = image_deploy(
+            self.project, self.run_in_repo,
+            _git_rev_parse(self.repo_dir, "HEAD", self.env, self.timeout),
+            env=self.env, timeout=self.timeout,
+            stage=lambda step: self.stage(f"deploy.{step}"),
+        )
+        self.output.write("Images: " + ", ".join(
+            f"{kind} {', '.join(services)}" for kind, services in images.items() if services
+        ))
+
+    def systemd(self):
+        service = self.project.get("service_name", self.project["name"])
+        self.run(["sudo", "systemctl", "restart", service])
+
+    def health(self):
+        health = run_health_checks(self.project.get("health_check", {}))
+        _emit({
+            "type": "health",
+            "project": self.project["name"],
+            "healthy": health["healthy"],
+            "targets": health["targets"],
+        })
+        for target in health["targets"]:
+            state = "passed" if target["healthy"] else f"failed ({target['error']})"
+            self.output.write(
+                f"Health check {state}: {target['target']} "
+                f"after {target['attempts']} attempt(s), {target['elapsed']:.1f}s"
+            )
+        if not health["healthy"]:
+            failed = [t["target"] for t in health["targets"] if not t["healthy"]]
+            if is_git_managed(self.project):
+                with self.stage("rollback"):
+                    self.rolled_back_to = _try_rollback(
+                        self.project, self.output, self.env, self.timeout)
+            raise RuntimeError(f"Health check failed: {', '.join(failed)}")
+
+    def record(self):
+        _record_release(self.project, self.output, self.env, self.timeout)
+
+    # Declared steps
+
+    def _run_step(self, step, record):
+        """Run a declared step unless its inputs are unchanged.
+
+        A step with ``inputs`` is skipped when the hash of its command and
+        input files matches its last successful run (and its ``outputs``,
+        if declared, still exist). The stage record gets "cache": "hit",
+        "miss" or "none" (no inputs declared).
+        """
+        name = step["name"]
+        cache = get_step_cache()
+        digest = None
+        if step.get("inputs"):
+            digest, count = hash_inputs(self.repo_dir, step, self.env, self.timeout)
+            if not count:
+                logger.warning("Step %s of %s: no file matches inputs %s",
+                               name, self.project["name"], step["inputs"])
+                self.output.write(f"Step {name}: no file matches its inputs, not cached")
+                digest = None
+            valid = digest if outputs_present(self.repo_dir, step) else None
+            if cache.lookup(self.project["name"], name, valid):
+                record["cache"] = "hit"
+                self.output.write(f"Step {name}: cache hit ({count} input file(s), "
+                                  f"{digest[:12]}), skipped")
+                return
+            record["cache"] = "miss"
+            if digest:
+                self.output.write(f"Step {name}: cache miss ({count} input file(s), "
+                                  f"{digest[:12]})")
+        else:
+            record["cache"] = "none"
+        self.run(["bash", "-c", step["run"]], cwd=self.repo_dir, prefix=f"[{name}] ")
+        if digest:
+            cache.store(self.project["name"], name, digest)
+
+    def write_cache_summary(self):
+        results = [s.get("cache") for s in self.stage.stages]
+        if "hit" in results or "miss" in results:
+            self.output.write(f"Step cache: {results.count('hit')} hit(s), "
+                              f"{results.count('miss')} miss(es)")
+
+    # Helpers
+
+    def _changed_files(self):
+        if self.project.get("service_paths") and self.before:
+            return _git_changed_files(self.repo_dir, self.before, self.env, self.timeout)
+        return None
+
+    def _compose_services(self):
+        """Services the swap nodes act on, computed once for all of them."""
+        with self._services_lock:
+            if self._services is None:
+                self._services = (affected_services(self.project, self._changed_files()),)
+            return self._services[0]
+
+    def _report_services(self, services):
+        if services is not None:
+            self.output.write(
+                f"Recreated only: {', '.join(services)}" if services
+                else "No compose services affected by this change"
+            )
+
+
+def _result(status, output, start, duration, stage, error=None, rolled_back_to=None):
+    return {
+        "success": status in ("success", "skipped"),
+        "status": status,
+        "output": output.tail.text(),
+        "started_at": start.isoformat(),
+        "duration": duration,
+        "stages": stage.stages,
+        "deploy_id": output.deploy_id,
+        "skipped": status == "skipped",
+        "rolled_back_to": rolled_back_to,
+        "resources": output.usage.as_dict(),
+        "error": error,
+    }
+
+
+def _record_release(project, output, env, timeout):
+    """Remember the deployed commit and images as the known-good release."""
+    sha = _git_rev_parse(project["path"], "HEAD", env, timeout)
+    if not sha:
+        return
+    try:
+        release = record_release(project, sha, env=env, timeout=timeout)
+    except OSError as e:
+        logger.warning("Could not record release for %s: %s", project["name"], e)
+        return
+    output.write(f"Recorded known-good release {sha[:12]} ({len(release['images'])} image(s))")
+
+
+def _try_rollback(project, output, env, timeout):
+    """Restore the last known-good release after a failed health check.
+
+    Returns the restored SHA, or None if there was nothing to restore or the
+    rollback itself failed.
+    """
+    if not project.get("rollback", True):
+        return None
+    siblings = _checkout_siblings(project)
+    if siblings:
+        # A reset would also move their files under their recorded releases
+        output.write(f"Not rolling back: {project['path']} is shared with "
+                     f"{', '.join(siblings)}")
+        logger.warning("Not rolling back %s: checkout shared with %s",
+                       project["name"], ", ".join(siblings))
+        return None
+    release = load_release(project["name"])
+    if not release:
+        output.write("No known-good release recorded, not rolling back")
+        return None
+
+    output.write(f"Rolling back to last known-good release {release['sha'][:12]}")
+    try:
+        rollback(
+            project, release,
+            lambda cmd: _run_cmd(cmd, output, env=env, timeout=timeout, cwd=project["path"]),
+        )
+    except (RuntimeError, subprocess.TimeoutExpired) as e:
+        output.write(f"Rollback failed: {e}")
+        return None
+
+    health = run_health_checks(project.get("health_check", {}))
+    output.write(
+        f"Health after rollback: {'passed' if health['healthy'] else 'still failing'}"
+    )
+    return release["sha"]
+
+
+def _checkout_siblings(project):
+    """Names of the other configured projects deployed from the same checkout."""
+    path = os.path.realpath(project["path"])
+    return [p["name"] for p in get_all_projects()
+            if p["name"] != project["name"] and os.path.realpath(p["path"]) == path]
+
+
+def _already_deployed(repo_dir, commit_info, previous, deployed_sha, env, timeout):
+    """Return the target SHA if it is the project's recorded release, else None.
+
+    The target is the pushed commit for webhook deploys, or the fetched
+    upstream for manual ones. It is compared with the commit the project
+    last deployed successfully, not the checkout's HEAD, which another
+    project sharing the checkout may already have moved. A project whose
+    last deploy did not succeed is never treated as deployed, so a
+    redelivery can retry it.
+    """
+    if not deployed_sha or previous is None or \
+            previous.get("status") not in ("success", "skipped"):
+        return None
+    target = (commit_info or {}).get("sha") or _git_rev_parse(repo_dir, "@{u}", env, timeout)
+    return target if target == deployed_sha else None
+
+
+def _no_matching_changes(project, commit_info, deployed_sha, env, timeout):
+    """True if a webhook push whose file list was truncated touches no filtered path.
+
+    The webhook handler already filtered pushes with a complete file list;
+    for the rest, diff the project's last deployed commit (HEAD if none
+    was recorded) against the fetched upstream.
+    """
+    if not commit_info or commit_info.get("files") is not None:
+        return False
+    if not has_path_filters(project):
+        return False
+    changed = _git_changed_files(project["path"], deployed_sha or "HEAD", env, timeout,
+                                 after="@{u}")
+    return changed is not None and not matching_paths(project, changed)
+
+
+def _git_changed_files(repo_dir, before, env, timeout, after="HEAD"):
+    """Return paths changed between before and after, or None if unknown.
+
+    An empty diff (a forced redeploy of the same commit) counts as unknown
+    so the caller redeploys everything.
+    """
+    result = subprocess.run(
+        ["git", "-C", repo_dir, "diff", "--name-only", before, after],
+        capture_output=True, text=True, env=env, timeout=timeout,
+    )
+    files = result.stdout.split("\n") if result.returncode == 0 else []
+    return [f for f in files if f] or None
+
+
+def _git_rev_parse(repo_dir, rev, env, timeout):
+    result = subprocess.run(
+        ["git", "-C", repo_dir, "rev-parse", "--verify", "--quiet", rev],
+        capture_output=True, text=True, env=env, timeout=timeout,
+    )
+    return result.stdout.strip() if result.returncode == 0 else None
 
 
 def _sanitize_env_value(value, max_length=500):
@@ -138,33 +520,93 @@ def _build_env(project, commit_info):
     return env
 
 
-def _run_cmd(cmd, env=None, timeout=300, cwd=None):
-    """Run a shell command and return its combined output."""
+def _run_cmd(cmd, output, env=None, timeout=300, cwd=None, prefix=""):
+    """Run a command, streaming its output into the deploy log and tail.
+
+    The command runs under the project's ``resources`` limits, is killed
+    when output.cancel is cancelled, and its resource usage is added to
+    output.usage. prefix is prepended to every output line.
+    """
     logger.info("Running: %s", " ".join(cmd))
-    result = subprocess.run(
-        cmd,
-        capture_output=True,
-        text=True,
-        timeout=timeout,
-        env=env,
-        cwd=cwd,
-    )
-    output = result.stdout + result.stderr
-    if result.returncode != 0:
+    output.write(f"{prefix}$ {' '.join(cmd)}")
+    on_line = (lambda line: output.write(prefix + line)) if prefix else output.write
+    returncode = stream_cmd(limit_cmd(cmd, output.limits), env=env, timeout=timeout,
+                            cwd=cwd, on_line=on_line, usage=output.usage,
+                            cancel=output.cancel)
+    if returncode != 0:
         raise RuntimeError(
-            f"Command failed (exit {result.returncode}): {' '.join(cmd)}\n{output}"
+            f"Command failed (exit {returncode}): {' '.join(cmd)}"
         )
-    return output.strip()
 
 
-def _write_log(log_file, name, status, output, duration):
-    """Append deploy result to the project's log file."""
-    timestamp = datetime.now(timezone.utc).isoformat()
-    entry = (
-        f"\n{'=' * 60}\n"
-        f"[{timestamp}] {name} - {status} ({duration:.1f}s)\n"
-        f"{'=' * 60}\n"
-        f"{output}\n"
-    )
-    with open(log_file, "a") as f:
-        f.write(entry)
+class _StageTimer:
+    """Records how long each named pipeline stage took and runs stage hooks.
+
+    Usage: ``with stage("fetch"): ...``; a stage that raises is still timed.
+    The context yields a dict whose items are added to the stage record.
+    """
+
+    def __init__(self, project_name):
+        self.project_name = project_name
+        self.stages = []
+
+    @contextlib.contextmanager
+    def __call__(self, name):
+        self._notify("start", name, None, None)
+        start = time.monotonic()
+        error = None
+        extra = {}
+        try:
+            yield extra
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            duration = time.monotonic() - start
+            self.stages.append({"name": name, "duration": round(duration, 3), **extra})
+            self._notify("end", name, duration, error)
+
+    def _notify(self, event, name, duration, error):
+        for hook in list(_stage_hooks):
+            try:
+                hook(event, self.project_name, name, duration, error)
+            except Exception:
+                logger.exception("Stage hook %r failed", hook)
+
+
+class _DeployOutput:
+    """Fans a deploy's output out to the project log, an in-memory tail and
+    the event listeners.
+
+    Each line is appended to the log file immediately; only the last
+    DEFAULT_TAIL_LINES lines are kept in memory for notifications and the
+    deploy result.
+    """
+
+    def __init__(self, log_dir, name, limits=None):
+        self.name = name
+        self.limits = limits
+        self.usage = ResourceUsage()
+        self.cancel = CancelToken()
+        self.tail = OutputTail()
+        self.log = DeployLogWriter(log_dir, name)
+        self._closed = False
+
+    @property
+    def deploy_id(self):
+        return self.log.deploy_id
+
+    def write(self, line):
+        self.tail.append(line)
+        self.log.write(line)
+        if _event_listeners:
+            _emit({"type": "output", "project": self.name, "line": line})
+
+    def close(self, status, duration):
+        """Write the resource summary and result footer to the log (idempotent)."""
+        if self._closed:
+            return
+        self._closed = True
+        if self.usage.commands:
+            self.write(f"Resources: {self.usage.summary()}")
+        self.log.close(status, duration)
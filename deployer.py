@@ -1,25 +1,43 @@
 """Pi-Deployer: Unified webhook deployment service for Raspberry Pi."""
 
+import json
 import logging
 import os
 import re
 import signal
-import threading
 from datetime import datetime, timezone
 
 from dotenv import load_dotenv
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 
 from config import (
     find_project_by_key,
     get_all_projects,
-    get_config,
-    get_project,
+    get_masked_config,
+    get_projects_by_repo,
     load_config,
-    mask_secrets,
 )
-from deploy import run_deploy
-from verify import verify_bearer_token, verify_signature
+from dedupe import DeliveryCache
+from deploy import add_event_listener, add_stage_hook, get_live_output, run_deploy
+from events import EventBroadcaster
+from gitops import (
+    DEFAULT_MAINTENANCE_IDLE,
+    DEFAULT_MAINTENANCE_INTERVAL,
+    RepoMaintainer,
+    prefetch,
+    prefetch_enabled,
+    stats as git_stats,
+)
+from history import HistoryStore
+from logstore import log_paths, read_deploy, tail_lines
+from metrics import Counter, Gauge, Histogram, Registry
+from notify import get_dispatcher
+from pathfilter import has_path_filters, matching_paths
+from releases import load_release
+from scheduler import DeployScheduler
+from stepcache import get_step_cache
+from verify import is_signature_header, verify_bearer_token, verify_signature
+from watcher import ConfigWatcher
 
 load_dotenv()
 
@@ -31,52 +49,94 @@ logger = logging.getLogger("pi-deployer")
 
 app = Flask(__name__)
 
-# Per-project concurrency locks
-_locks = {}
-_locks_mutex = threading.Lock()
+# Requests with a larger body are refused with 413 before being read
+app.config["MAX_CONTENT_LENGTH"] = int(os.environ.get("MAX_BODY_BYTES", 2 * 1024 * 1024))
 
-# Deploy status tracking
-_deploy_status = {}
+# Persistent deploy history (also backs the per-project part of /status)
+_history = HistoryStore(os.environ.get(
+    "HISTORY_DB",
+    os.path.join(os.environ.get("STATE_DIR", "./state"), "history.db"),
+))
 
-# Server start time
-_start_time = datetime.now(timezone.utc)
+# Recently seen webhook deliveries, so GitHub redeliveries are not deployed twice
+_deliveries = DeliveryCache(
+    os.path.join(os.environ.get("STATE_DIR", "./state"), "deliveries.journal"),
+    max_entries=int(os.environ.get("DEDUPE_MAX_ENTRIES", "1000")),
+    ttl=float(os.environ.get("DEDUPE_TTL", "86400")),
+)
+
+# Accepted deploys that were still queued at shutdown, resumed on the next start
+_QUEUE_FILE = os.path.join(os.environ.get("STATE_DIR", "./state"), "queued.json")
+
+# Live deploy events for /events subscribers
+_events = EventBroadcaster(
+    max_subscribers=int(os.environ.get("EVENTS_MAX_SUBSCRIBERS", "4")),
+    queue_size=int(os.environ.get("EVENTS_QUEUE_SIZE", "1000")),
+)
+add_event_listener(_events.publish)
+
+# Seconds between keep-alive comments on idle /events streams
+EVENTS_HEARTBEAT = 15
 
+# Upper bound for ?limit= on /logs
+MAX_LOG_LINES = 1000
 
-def _get_lock(project_name):
-    """Get or create a lock for a project."""
-    with _locks_mutex:
-        if project_name not in _locks:
-            _locks[project_name] = threading.Lock()
-        return _locks[project_name]
+# Upper bound for ?limit= on /history
+MAX_HISTORY_ROWS = 500
 
+# Server start time
+_start_time = datetime.now(timezone.utc)
 
-def _sync_locks():
-    """Sync locks dict with current projects after config reload."""
-    with _locks_mutex:
-        current_names = {p["name"] for p in get_all_projects()}
-        # Remove locks for deleted projects (only if not locked)
-        for name in list(_locks.keys()):
-            if name not in current_names and not _locks[name].locked():
-                del _locks[name]
-        # New projects get locks on demand via _get_lock
+
+# GitHub lists at most this many commits in a push payload
+MAX_PAYLOAD_COMMITS = 20
 
 
 def _extract_commit_info(payload):
-    """Extract commit info from GitHub webhook payload."""
+    """Extract commit info from GitHub webhook payload.
+
+    "files" holds every path added, modified or removed by the pushed
+    commits, or None when the payload's commit list may be truncated or is
+    empty (a force-push or reset to an existing commit still moves the
+    checkout).
+    """
     head_commit = payload.get("head_commit", {})
     if not head_commit:
         return None
+    commits = payload.get("commits")
+    files = None
+    if isinstance(commits, list) and 0 < len(commits) < MAX_PAYLOAD_COMMITS:
+        files = sorted({
+            path
+            for commit in commits
+            for key in ("added", "modified", "removed")
+            for path in commit.get(key) or []
+        })
     return {
         "sha": head_commit.get("id", ""),
         "message": head_commit.get("message", ""),
         "author": head_commit.get("author", {}).get("name", "unknown"),
         "url": head_commit.get("url", ""),
+        "files": files,
     }
 
 
 _PROJECT_KEY_RE = re.compile(r"^[a-zA-Z0-9_-]+$")
 
 
+# repository.full_name in a push payload: GitHub serialises it before any
+# nested object of the repository, so the first match is the right one
+_REPO_FULL_NAME_RE = re.compile(
+    rb'"repository"\s*:\s*\{[^{}]*?"full_name"\s*:\s*"([A-Za-z0-9_.-]+/[A-Za-z0-9_.-]+)"'
+)
+
+
+def _repo_from_raw(body):
+    """Find repository.full_name in the raw payload without parsing the JSON."""
+    match = _REPO_FULL_NAME_RE.search(body)
+    return match.group(1).decode("ascii") if match else ""
+
+
 def _validate_project_key(key):
     """Validate project key format to prevent path traversal."""
     if not key or len(key) > 100 or not _PROJECT_KEY_RE.match(key):
@@ -84,30 +144,119 @@ def _validate_project_key(key):
     return key
 
 
-def _deploy_in_background(project, commit_info, lock):
-    """Run deployment in a background thread (lock already acquired by caller)."""
+def _run_one(project, commit_info, force=False):
+    """Run a single deploy and record its outcome in the deploy history."""
     name = project["name"]
+    entry = {
+        "project": name,
+        "trigger": "webhook" if commit_info else ("manual-force" if force else "manual"),
+        "commit_sha": (commit_info or {}).get("sha"),
+    }
+    started_at = datetime.now(timezone.utc).isoformat()
+    try:
+        result = run_deploy(project, commit_info, force=force)
+        entry.update({
+            "deploy_id": result["deploy_id"],
+            "status": result["status"],
+            "started_at": result["started_at"],
+            "duration": result["duration"],
+            "stages": result["stages"],
+            "rolled_back_to": result["rolled_back_to"],
+            "error": result["error"],
+            "resources": result["resources"],
+        })
+    except Exception as e:
+        logger.error("Deploy thread error for %s: %s", name, e)
+        entry.update({"status": "failed", "started_at": started_at, "error": str(e)})
+    entry["finished_at"] = datetime.now(timezone.utc).isoformat()
+    if entry["status"] in ("failed", "timeout", "rolled-back") and commit_info:
+        # A redelivery (or a new push of the same commit) may retry it
+        _deliveries.discard(_delivery_keys(name, commit_info.get("sha"),
+                                           commit_info.get("delivery")))
+    _history.record(entry)
+    _events.publish({
+        "type": "finished",
+        "project": name,
+        "status": entry["status"],
+        "deploy_id": entry.get("deploy_id"),
+        "duration": entry.get("duration"),
+        "rolled_back_to": entry.get("rolled_back_to"),
+        "error": entry.get("error"),
+        "resources": entry.get("resources"),
+    })
+    if entry.get("duration") is not None:
+        _deploy_seconds.observe(entry["duration"], name, entry["status"])
 
-    def _run():
-        try:
-            result = run_deploy(project, commit_info)
-            _deploy_status[name] = {
-                "last_deploy": datetime.now(timezone.utc).isoformat(),
-                "success": result["success"],
-                "duration": result["duration"],
-            }
-        except Exception as e:
-            logger.error("Deploy thread error for %s: %s", name, e)
-            _deploy_status[name] = {
-                "last_deploy": datetime.now(timezone.utc).isoformat(),
-                "success": False,
-                "error": str(e),
-            }
-        finally:
-            lock.release()
 
-    thread = threading.Thread(target=_run, name=f"deploy-{name}", daemon=True)
-    thread.start()
+def _delivery_keys(name, sha, delivery):
+    """Duplicate-detection keys of a push for one project (None where unknown)."""
+    return [delivery and f"delivery:{delivery}:{name}", sha and f"commit:{name}:{sha}"]
+
+
+def _optional_float_env(name):
+    value = os.environ.get(name, "")
+    return float(value) if value else None
+
+
+_scheduler = DeployScheduler(
+    _run_one,
+    concurrency=int(os.environ.get("DEPLOY_CONCURRENCY", "2")),
+    max_load=_optional_float_env("DEPLOY_MAX_LOAD"),
+    min_free_mb=_optional_float_env("DEPLOY_MIN_FREE_MB"),
+    admission_timeout=float(os.environ.get("DEPLOY_ADMISSION_TIMEOUT", "600")),
+)
+
+
+# --- Metrics ---
+
+_metrics = Registry()
+_webhooks = _metrics.register(Counter(
+    "pideployer_webhooks_total",
+    "Webhook outcomes (accepted, skipped, rejected) by reason; "
+    "accepted/skipped are counted per matched project.",
+    ("outcome", "reason"),
+))
+_deploy_seconds = _metrics.register(Histogram(
+    "pideployer_deploy_duration_seconds",
+    "Total deploy duration by project and final status.",
+    ("project", "status"),
+))
+_stage_seconds = _metrics.register(Histogram(
+    "pideployer_deploy_stage_seconds",
+    "Duration of each deploy pipeline stage.",
+    ("project", "stage"),
+))
+_metrics.register(Gauge(
+    "pideployer_queue_depth",
+    "Deploys waiting in the scheduler queue.",
+    lambda: _scheduler.snapshot()["queue_depth"],
+))
+_metrics.register(Gauge(
+    "pideployer_deploys_in_flight",
+    "Deploys currently running.",
+    lambda: len(_scheduler.snapshot()["running"]),
+))
+
+
+def _observe_stage(event, project_name, stage, duration, error):
+    if event == "end":
+        _stage_seconds.observe(duration, project_name, stage)
+    _events.publish({
+        "type": f"stage_{event}",
+        "project": project_name,
+        "stage": stage,
+        "duration": round(duration, 3) if duration is not None else None,
+        "error": str(error) if error else None,
+    })
+
+
+add_stage_hook(_observe_stage)
+
+
+def _webhook_response(outcome, reason, body, code):
+    """Count a webhook outcome for /metrics and build its response."""
+    _webhooks.inc(outcome, reason)
+    return jsonify(body), code
 
 
 # --- Routes ---
@@ -116,52 +265,104 @@ def _deploy_in_background(project, commit_info, lock):
 @app.route("/deploy", methods=["POST"])
 def webhook_deploy():
     """GitHub webhook endpoint."""
-    payload = request.get_json(silent=True)
-    if not payload:
-        return jsonify({"error": "Invalid payload"}), 400
-
-    repo_full_name = payload.get("repository", {}).get("full_name", "")
+    # Cheap rejections first: no body is read or parsed for junk requests
+    signature = request.headers.get("X-Hub-Signature-256", "")
+    if not is_signature_header(signature):
+        return _webhook_response("rejected", "signature", {"error": "Invalid signature"}, 401)
+    if request.content_length is not None and \
+            request.content_length > app.config["MAX_CONTENT_LENGTH"]:
+        return _webhook_response("rejected", "too_large", {"error": "Payload too large"}, 413)
+
+    body = request.get_data(cache=False)
+    repo_full_name = _repo_from_raw(body)
     if not repo_full_name:
-        return jsonify({"error": "Missing repository.full_name"}), 400
+        return _webhook_response("rejected", "invalid_payload",
+                                 {"error": "Missing repository.full_name"}, 400)
+
+    projects = get_projects_by_repo(repo_full_name)
+    if not projects:
+        return _webhook_response("rejected", "unknown_project",
+                                 {"error": f"Unknown project: {repo_full_name}"}, 404)
+
+    # Verify HMAC signature over the raw bytes before parsing anything
+    secrets = {p["name"]: p.get("webhook_secret") or os.environ.get("GITHUB_WEBHOOK_SECRET", "")
+               for p in projects}
+    if not any(secrets.values()):
+        return _webhook_response("rejected", "no_secret",
+                                 {"error": "No webhook secret configured"}, 401)
+
+    # Projects sharing a repo may use different secrets; each secret is checked once
+    valid = {secret: verify_signature(body, signature, secret)
+             for secret in set(secrets.values()) if secret}
+    projects = [p for p in projects if valid.get(secrets[p["name"]])]
+    if not projects:
+        return _webhook_response("rejected", "signature", {"error": "Invalid signature"}, 401)
 
-    project = get_project(repo_full_name)
-    if not project:
-        return jsonify({"error": f"Unknown project: {repo_full_name}"}), 404
-
-    # Verify HMAC signature
-    secret = project.get("webhook_secret") or os.environ.get("GITHUB_WEBHOOK_SECRET", "")
-    if not secret:
-        return jsonify({"error": "No webhook secret configured"}), 401
-
-    signature = request.headers.get("X-Hub-Signature-256", "")
-    if not verify_signature(request.get_data(), signature, secret):
-        return jsonify({"error": "Invalid signature"}), 401
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        payload = None
+    if not isinstance(payload, dict) or \
+            (payload.get("repository") or {}).get("full_name") != repo_full_name:
+        return _webhook_response("rejected", "invalid_payload",
+                                 {"error": "Invalid payload"}, 400)
 
-    # Branch check
     ref = payload.get("ref", "")
-    expected_branch = project.get("branch", "main")
     push_branch = ref.replace("refs/heads/", "", 1) if ref.startswith("refs/heads/") else ref
+    commit_info = _extract_commit_info(payload)
+    delivery = request.headers.get("X-GitHub-Delivery")
+    if commit_info:
+        commit_info["delivery"] = delivery
+
+    results = [_dispatch_push(p, push_branch, commit_info, delivery) for p in projects]
+    started = [r for r in results if r["status"] in ("accepted", "queued")]
+    if started:
+        status, code = "accepted", 202
+    elif any(r["status"] == "rejected" for r in results):
+        status, code = "rejected", 503
+    else:
+        status, code = "skipped", 200
+    return jsonify({"status": status, "projects": results}), code
+
+
+def _dispatch_push(project, push_branch, commit_info, delivery):
+    """Apply one project's branch, path and duplicate checks to a push, then queue it."""
+    name = project["name"]
+    expected_branch = project.get("branch", "main")
     if push_branch != expected_branch:
-        return jsonify({
+        _webhooks.inc("skipped", "branch")
+        return {
+            "project": name,
             "status": "skipped",
             "reason": f"Branch mismatch: got {push_branch}, expected {expected_branch}",
-        }), 200
-
-    # Concurrency check (atomic acquire to avoid race condition)
-    lock = _get_lock(project["name"])
-    if not lock.acquire(blocking=False):
-        return jsonify({
-            "error": "Deploy already in progress",
-            "project": project["name"],
-        }), 409
-
-    commit_info = _extract_commit_info(payload)
-    _deploy_in_background(project, commit_info, lock)
-
-    return jsonify({
-        "status": "accepted",
-        "project": project["name"],
-    }), 202
+        }
+
+    files = (commit_info or {}).get("files")
+    if files is not None and has_path_filters(project) and not matching_paths(project, files):
+        _webhooks.inc("skipped", "paths")
+        return {"project": name, "status": "skipped",
+                "reason": "No changed files match include_paths / ignore_paths"}
+
+    sha = (commit_info or {}).get("sha")
+    keys = _delivery_keys(name, sha, delivery)
+    duplicate = _deliveries.check_and_add(keys)
+    if duplicate:
+        _webhooks.inc("skipped", "duplicate")
+        return {"project": name, "status": "skipped",
+                "reason": f"Duplicate delivery ({duplicate})"}
+
+    outcome = _submit(project, commit_info, "webhook")
+    # "queued" replaces the commit of a waiting job (formerly a 409 conflict)
+    if outcome == "rejected":
+        # Never deployed: GitHub's redelivery after the restart must get through
+        _deliveries.discard(keys)
+        _webhooks.inc("rejected", "shutting_down")
+    else:
+        # Fetch now, so the objects are local by the time the deploy starts
+        if prefetch_enabled(project):
+            prefetch(project, sha)
+        _webhooks.inc("accepted", "coalesced" if outcome == "queued" else "new")
+    return _submit_body(project, outcome)
 
 
 @app.route("/deploy/<project_key>", methods=["POST"])
@@ -179,19 +380,45 @@ def manual_deploy(project_key):
     if not project:
         return jsonify({"error": f"Unknown project: {project_key}"}), 404
 
-    lock = _get_lock(project["name"])
-    if not lock.acquire(blocking=False):
-        return jsonify({
-            "error": "Deploy already in progress",
-            "project": project["name"],
-        }), 409
+    body = request.get_json(silent=True)
+    force = _truthy(request.args.get("force")) or \
+        (isinstance(body, dict) and body.get("force") is True)
+    return _submit_response(project, _submit(project, None, "manual", force=force))
 
-    _deploy_in_background(project, None, lock)
 
-    return jsonify({
-        "status": "accepted",
+def _truthy(value):
+    return (value or "").lower() in ("1", "true", "yes")
+
+
+def _submit(project, commit_info, trigger, force=False):
+    """Hand a deploy to the scheduler and announce it to /events subscribers."""
+    outcome = _scheduler.submit(project, commit_info, force=force)
+    _events.publish({
+        "type": "queued",
         "project": project["name"],
-    }), 202
+        "status": outcome,
+        "trigger": trigger,
+        "commit": (commit_info or {}).get("sha"),
+    })
+    return outcome
+
+
+def _submit_response(project, outcome):
+    return jsonify(_submit_body(project, outcome)), 503 if outcome == "rejected" else 202
+
+
+def _submit_body(project, outcome):
+    body = {"project": project["name"], "status": outcome}
+    if outcome == "rejected":
+        body["message"] = "Deployer is shutting down"
+    elif outcome == "queued":
+        body["message"] = "Deploy already queued or running; the newest commit will be deployed"
+    return body
+
+
+@app.errorhandler(413)
+def payload_too_large(e):
+    return jsonify({"error": "Payload too large"}), 413
 
 
 @app.route("/health", methods=["GET"])
@@ -212,22 +439,153 @@ def status():
     projects = []
     for p in get_all_projects():
         name = p["name"]
-        lock = _get_lock(name)
-        deploy_info = _deploy_status.get(name, {})
+        deploy_info = _status_fields(_history.latest(name))
         projects.append({
             "name": name,
             "repo": p.get("repo", ""),
             "branch": p.get("branch", "main"),
             "deploy_mode": p.get("deploy_mode", ""),
-            "deploying": lock.locked(),
+            **_scheduler.project_state(name),
             **deploy_info,
         })
-    return jsonify({"projects": projects})
+        release = load_release(name)
+        if release:
+            projects[-1]["last_good_commit"] = release["sha"]
+    return jsonify({
+        "projects": projects,
+        "scheduler": _scheduler.snapshot(),
+        "dedupe": _deliveries.stats(),
+        "events": _events.stats(),
+        "git": git_stats(),
+        "step_cache": get_step_cache().stats(),
+    })
+
+
+def _status_fields(entry):
+    """Summarise a history entry for /status."""
+    if not entry:
+        return {}
+    fields = {
+        "last_deploy": entry["finished_at"],
+        "last_status": entry["status"],
+        "success": entry["status"] in ("success", "skipped"),
+        "skipped": entry["status"] == "skipped",
+        "rolled_back_to": entry["rolled_back_to"],
+        "duration": entry["duration"],
+        "deploy_id": entry["deploy_id"],
+    }
+    if entry.get("error"):
+        fields["error"] = entry["error"]
+    return fields
+
+
+@app.route("/history", methods=["GET"])
+def history():
+    """Query past deploys, newest first (requires Bearer token).
+
+    Query params:
+        project: Only this project (name).
+        status: Only this outcome (success, failed, skipped, timeout, rolled-back).
+        since / until: ISO timestamps bounding the start time.
+        limit: Rows per page (default 50, max 500).
+        offset: Rows to skip (default 0).
+    """
+    token = os.environ.get("DEPLOY_TOKEN", "")
+    auth = request.headers.get("Authorization", "")
+    if not verify_bearer_token(auth, token):
+        return jsonify({"error": "Unauthorized"}), 401
+
+    try:
+        limit = min(_int_arg("limit", 50), MAX_HISTORY_ROWS)
+        offset = _int_arg("offset", 0)
+    except ValueError:
+        return jsonify({"error": "offset and limit must be non-negative integers"}), 400
+
+    total, deploys = _history.query(
+        project=request.args.get("project"),
+        status=request.args.get("status"),
+        since=request.args.get("since"),
+        until=request.args.get("until"),
+        limit=limit,
+        offset=offset,
+    )
+    return jsonify({"total": total, "offset": offset, "limit": limit, "deploys": deploys})
+
+
+@app.route("/history/stats", methods=["GET"])
+def history_stats():
+    """Per-project deploy count, failure rate and p50/p95 duration."""
+    token = os.environ.get("DEPLOY_TOKEN", "")
+    auth = request.headers.get("Authorization", "")
+    if not verify_bearer_token(auth, token):
+        return jsonify({"error": "Unauthorized"}), 401
+
+    return jsonify({"projects": _history.stats(
+        project=request.args.get("project"),
+        since=request.args.get("since"),
+        until=request.args.get("until"),
+    )})
+
+
+@app.route("/events", methods=["GET"])
+def events():
+    """Server-Sent Events stream of live deploy events (requires Bearer token).
+
+    The token may also be given as ?token= for EventSource clients, which
+    cannot set headers.
+
+    Query params:
+        project: Only events of this project (name).
+        output: 0 to leave out command output lines.
+    """
+    token = os.environ.get("DEPLOY_TOKEN", "")
+    auth = request.headers.get("Authorization") or f"Bearer {request.args.get('token', '')}"
+    if not verify_bearer_token(auth, token):
+        return jsonify({"error": "Unauthorized"}), 401
+
+    subscriber = _events.subscribe(
+        project=request.args.get("project"),
+        output=request.args.get("output", "1") != "0",
+    )
+    if subscriber is None:
+        return jsonify({"error": "Too many event subscribers"}), 503
+
+    def stream():
+        try:
+            yield "retry: 5000\n\n"
+            while not subscriber.dropped:
+                event = subscriber.get(timeout=EVENTS_HEARTBEAT)
+                if event is None:
+                    if subscriber.closed:
+                        return
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"id: {event.get('id', '')}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+                if event["type"] == "shutdown":
+                    return
+            yield 'event: dropped\ndata: {"reason": "client too slow"}\n\n'
+        finally:
+            _events.unsubscribe(subscriber)
+
+    return Response(stream(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Prometheus text-format metrics."""
+    return Response(_metrics.render(), mimetype="text/plain; version=0.0.4")
 
 
 @app.route("/logs/<project_key>", methods=["GET"])
 def logs(project_key):
-    """Return last 50 lines of a project's deploy log."""
+    """Return a page of a project's deploy log, or one past deploy entry.
+
+    Query params:
+        offset: Lines to skip back from the end of the log (default 0).
+        limit: Number of lines to return (default 50, max 1000).
+        deploy: Deploy id; returns that deploy's entry instead of the tail.
+    """
     if not _validate_project_key(project_key):
         return jsonify({"error": "Invalid project key"}), 400
 
@@ -240,8 +598,15 @@ def logs(project_key):
     if not project:
         return jsonify({"error": f"Unknown project: {project_key}"}), 404
 
+    try:
+        offset = _int_arg("offset", 0)
+        limit = min(_int_arg("limit", 50), MAX_LOG_LINES)
+        deploy_id = _int_arg("deploy", None)
+    except ValueError:
+        return jsonify({"error": "offset, limit and deploy must be non-negative integers"}), 400
+
     log_dir = os.environ.get("LOG_DIR", "./logs")
-    log_file = os.path.join(log_dir, f"{project_key}.log")
+    log_file, _ = log_paths(log_dir, project_key)
 
     # Symlink protection: ensure resolved path stays within log_dir
     log_file_real = os.path.realpath(log_file)
@@ -249,27 +614,42 @@ def logs(project_key):
     if not log_file_real.startswith(log_dir_real + os.sep):
         return jsonify({"error": "Invalid log path"}), 400
 
-    if not os.path.isfile(log_file_real):
-        return jsonify({"project": project_key, "lines": []})
-
-    with open(log_file_real, "r") as f:
-        all_lines = f.readlines()
+    if deploy_id is not None:
+        entry = read_deploy(log_dir_real, project_key, deploy_id)
+        if entry is None:
+            return jsonify({"error": f"Unknown deploy: {deploy_id}"}), 404
+        record, lines = entry
+        return jsonify({"project": project_key, "deploy": record, "lines": lines})
 
-    tail = all_lines[-50:]
-    return jsonify({
+    response = {
         "project": project_key,
-        "lines": [line.rstrip("\n") for line in tail],
-    })
+        "offset": offset,
+        "limit": limit,
+        "lines": tail_lines(log_file_real, limit=limit, offset=offset),
+    }
+    live = get_live_output(project["name"])
+    if live is not None:
+        response["live"] = live
+    return jsonify(response)
+
+
+def _int_arg(name, default):
+    """Parse a non-negative integer query param (ValueError if malformed)."""
+    raw = request.args.get(name)
+    if raw is None:
+        return default
+    if not raw.isdigit():
+        raise ValueError(f"Invalid {name}: {raw}")
+    return int(raw)
 
 
 @app.route("/config", methods=["GET"])
 def config_endpoint():
-    """Return current config with secrets masked."""
-    cfg = get_config()
-    return jsonify(mask_secrets({
-        "defaults": cfg["defaults"],
-        "projects": cfg["projects"],
-    }))
+    """Return current config with secrets masked (ETag / 304 aware)."""
+    body, etag = get_masked_config()
+    response = Response(body, mimetype="application/json")
+    response.set_etag(etag)
+    return response.make_conditional(request)
 
 
 @app.route("/reload", methods=["POST"])
@@ -281,11 +661,11 @@ def reload_config():
         return jsonify({"error": "Unauthorized"}), 401
 
     try:
-        load_config()
-        _sync_locks()
+        changes = load_config()
         return jsonify({
             "status": "reloaded",
             "projects": len(get_all_projects()),
+            **changes,
         })
     except Exception as e:
         logger.error("Config reload failed: %s", e)
@@ -310,20 +690,151 @@ def _sighup_handler(signum, frame):
     logger.info("Received SIGHUP, reloading config...")
     try:
         load_config()
-        _sync_locks()
         logger.info("Config reloaded via SIGHUP")
     except Exception as e:
         logger.error("SIGHUP config reload failed: %s", e)
 
 
+def _file_change_reload():
+    logger.info("%s changed, reloading config...", _config_path())
+    load_config()
+
+
+def _config_path():
+    return os.environ.get("PROJECTS_CONFIG", "./projects.yml")
+
+
+def _sigterm_handler(signum, frame):
+    """Stop accepting requests; the drain runs once the server loop exits.
+
+    A second SIGTERM during the drain terminates immediately.
+    """
+    logger.info("Received SIGTERM, shutting down...")
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    _events.close()
+    raise SystemExit(0)
+
+
+def _serve(host, port, debug):
+    """Run the HTTP server until SIGTERM / Ctrl-C.
+
+    SERVER=waitress (default) uses waitress: one process with a thread pool,
+    which keeps the scheduler, locks and caches shared. SERVER=flask (or
+    FLASK_DEBUG=true) uses Flask's development server.
+    """
+    server = os.environ.get("SERVER", "waitress").lower()
+    if debug or server == "flask":
+        logger.info("Starting pi-deployer on %s:%d (Flask development server)", host, port)
+        app.run(host=host, port=port, debug=debug)
+        return
+
+    from waitress import create_server
+
+    threads = int(os.environ.get("SERVER_THREADS", "8"))
+    server = create_server(
+        app,
+        host=host,
+        port=port,
+        threads=threads,
+        connection_limit=int(os.environ.get("SERVER_CONNECTION_LIMIT", "100")),
+        channel_timeout=int(os.environ.get("SERVER_CHANNEL_TIMEOUT", "60")),
+        ident="pi-deployer",
+    )
+    logger.info("Starting pi-deployer on %s:%d (waitress, %d threads)", host, port, threads)
+    try:
+        server.run()  # Returns after SIGTERM / Ctrl-C once request threads are done
+    finally:
+        server.close()
+
+
+def _drain(timeout):
+    """Let running deploys finish and flush pending notifications and history."""
+    logger.info("Draining: waiting up to %.0fs for running deploys", timeout)
+    _finished, dropped = _scheduler.shutdown(timeout)
+    for project, commit_info, _force in dropped:
+        # Accepted but never deployed: let GitHub's redelivery through
+        if commit_info:
+            _deliveries.discard(_delivery_keys(project["name"], commit_info.get("sha"),
+                                               commit_info.get("delivery")))
+    _save_queued(dropped)
+    dispatcher = get_dispatcher()
+    if dispatcher and not dispatcher.flush(timeout=15):
+        logger.warning("Some Telegram notifications were not delivered before exit")
+    if not _history.flush(timeout=10):
+        logger.warning("Some deploy history records were not written before exit")
+    logger.info("Shutdown complete")
+
+
+def _save_queued(dropped):
+    """Persist deploys that were accepted but never started, for _resume_queued."""
+    if not dropped:
+        return
+    jobs = [{"project": project["name"], "commit_info": commit_info, "force": force}
+            for project, commit_info, force in dropped]
+    try:
+        os.makedirs(os.path.dirname(_QUEUE_FILE) or ".", exist_ok=True)
+        tmp = _QUEUE_FILE + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(jobs, f)
+        os.replace(tmp, _QUEUE_FILE)
+    except OSError as e:
+        logger.error("Could not save queued deploys (%s): %s", e,
+                     ", ".join(job["project"] for job in jobs))
+        return
+    logger.info("Saved %d queued deploy(s) to resume on the next start", len(jobs))
+
+
+def _resume_queued():
+    """Queue again the deploys _save_queued stored at the last shutdown."""
+    try:
+        with open(_QUEUE_FILE, "r") as f:
+            jobs = json.load(f)
+        os.remove(_QUEUE_FILE)
+    except FileNotFoundError:
+        return
+    except (OSError, ValueError) as e:
+        logger.warning("Could not read queued deploys from %s: %s", _QUEUE_FILE, e)
+        return
+    for job in jobs if isinstance(jobs, list) else []:
+        project = find_project_by_key(job.get("project", ""))
+        if not project:
+            logger.warning("Not resuming queued deploy of unknown project %s",
+                           job.get("project"))
+            continue
+        commit_info = job.get("commit_info")
+        logger.info("Resuming deploy of %s queued before the last shutdown", project["name"])
+        _submit(project, commit_info, "webhook" if commit_info else "manual",
+                force=bool(job.get("force")))
+
+
 if __name__ == "__main__":
     load_config()
+    _resume_queued()
 
     signal.signal(signal.SIGHUP, _sighup_handler)
+    if os.environ.get("CONFIG_WATCH", "true").lower() == "true":
+        ConfigWatcher(
+            _config_path(), _file_change_reload,
+            poll_interval=float(os.environ.get("CONFIG_POLL_INTERVAL", "2")),
+        ).start()
+
+    maintenance_interval = float(os.environ.get("MAINTENANCE_INTERVAL",
+                                                str(DEFAULT_MAINTENANCE_INTERVAL)))
+    if maintenance_interval > 0:
+        RepoMaintainer(
+            get_all_projects, _scheduler.is_idle, interval=maintenance_interval,
+            idle=float(os.environ.get("MAINTENANCE_IDLE", str(DEFAULT_MAINTENANCE_IDLE))),
+        ).start()
+
+    signal.signal(signal.SIGTERM, _sigterm_handler)
 
     host = os.environ.get("FLASK_HOST", "0.0.0.0")
     port = int(os.environ.get("FLASK_PORT", "5000"))
     debug = os.environ.get("FLASK_DEBUG", "false").lower() == "true"
 
-    logger.info("Starting pi-deployer on %s:%d", host, port)
-    app.run(host=host, port=port, debug=debug)
+    try:
+        _serve(host, port, debug)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        _drain(float(os.environ.get("DRAIN_TIMEOUT", "600")))
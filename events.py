@@ -0,0 +1,111 @@
+"""Fan-out of live deploy events to /events subscribers.
+
+Every subscriber gets its own bounded queue. Publishing never blocks: a
+subscriber whose queue is full is dropped (its stream ends with a
+"dropped" event) instead of making the deploy thread wait or letting the
+buffer grow without limit.
+"""
+
+import itertools
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger("pi-deployer")
+
+DEFAULT_MAX_SUBSCRIBERS = 4
+DEFAULT_QUEUE_SIZE = 1000
+
+
+class Subscriber:
+    def __init__(self, project=None, output=True, queue_size=DEFAULT_QUEUE_SIZE):
+        self.project = project
+        self.output = output
+        self.dropped = False
+        self.closed = False
+        self._queue = queue.Queue(maxsize=queue_size)
+
+    def wants(self, event):
+        if self.project and event.get("project") != self.project:
+            return False
+        return self.output or event["type"] != "output"
+
+    def get(self, timeout):
+        """Return the next event, or None if none arrived within timeout."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class EventBroadcaster:
+    """Publishes events to a bounded set of subscribers.
+
+    Args:
+        max_subscribers: subscribe() returns None beyond this many streams.
+        queue_size: Events buffered per subscriber before it is dropped.
+    """
+
+    def __init__(self, max_subscribers=DEFAULT_MAX_SUBSCRIBERS, queue_size=DEFAULT_QUEUE_SIZE):
+        self.max_subscribers = max_subscribers
+        self.queue_size = queue_size
+        self.dropped_total = 0
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def subscribe(self, project=None, output=True):
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            subscriber = Subscriber(project, output, self.queue_size)
+            self._subscribers.add(subscriber)
+            return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, event):
+        """Queue event for every interested subscriber (never blocks).
+
+        Adds "id" and "time" to the event.
+        """
+        if not self._subscribers:
+            return
+        event = {**event, "id": next(self._ids), "time": round(time.time(), 3)}
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            if not subscriber.wants(event):
+                continue
+            try:
+                subscriber._queue.put_nowait(event)
+            except queue.Full:
+                self._drop(subscriber)
+
+    def close(self):
+        """End every stream with a "shutdown" event (used on SIGTERM)."""
+        with self._lock:
+            subscribers = list(self._subscribers)
+            self._subscribers.clear()
+        for subscriber in subscribers:
+            subscriber.closed = True
+            try:
+                subscriber._queue.put_nowait({"type": "shutdown"})
+            except queue.Full:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {"subscribers": len(self._subscribers), "dropped": self.dropped_total}
+
+    def _drop(self, subscriber):
+        with self._lock:
+            if subscriber not in self._subscribers:
+                return
+            self._subscribers.discard(subscriber)
+            self.dropped_total += 1
+        subscriber.dropped = True
+        logger.warning("Dropped slow /events subscriber (%d events buffered)", self.queue_size)
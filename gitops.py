@@ -0,0 +1,259 @@
+"""Git fetch and repository upkeep for pi-deployer.
+
+A webhook starts a background ``git fetch`` of the project's repo right
+away (prefetch), even while its deploy is queued behind another one, so
+the objects are already local when the deploy's fetch stage runs; if the
+pushed commit is already the upstream ref, that stage skips the network.
+All fetches of a repo are serialised by a per-repo lock, so a prefetch
+and a deploy never race for the same refs. (Whole deploys of projects
+sharing a checkout are kept apart by the scheduler.)
+
+RepoMaintainer writes the commit-graph and runs ``git gc --auto`` for each
+repo while the deployer is idle, at low CPU and I/O priority.
+"""
+
+import logging
+import os
+import subprocess
+import threading
+import time
+
+from runner import limit_cmd, stream_cmd
+
+logger = logging.getLogger("pi-deployer")
+
+DEFAULT_MAINTENANCE_INTERVAL = 86400
+DEFAULT_MAINTENANCE_IDLE = 300
+_MAINTENANCE_POLL = 30
+_MAINTENANCE_LIMITS = {"nice": 19, "ionice": "idle"}
+
+# Keyed by _repo_key(path), so spellings of one checkout share an entry
+_locks = {}       # repo path -> Lock held while fetching
+_pending = set()  # repo paths with a prefetch waiting for the lock
+_configured = {}  # repo path -> fetch_filter applied to it
+_state_lock = threading.Lock()
+_stats = {"prefetches": 0, "prefetch_failures": 0, "fetch_skipped": 0,
+          "maintenance_runs": 0, "maintenance_failures": 0}
+
+
+def is_git_managed(project):
+    """Whether run_deploy fetches and fast-forwards the project's checkout."""
+    return project.get("deploy_mode", "pull-only") != "script-only" and not project.get(
+        "deploy_script")
+
+
+def prefetch_enabled(project):
+    return (os.environ.get("PREFETCH", "true").lower() == "true"
+            and project.get("prefetch", True) and is_git_managed(project))
+
+
+def fetch_cmd(project):
+    """The ``git fetch`` command for a project.
+
+    Deliberately never ``--depth``: that moves the shallow boundary to the
+    new tip, and the following ``merge --ff-only @{u}`` then finds no
+    common history with HEAD. Use ``fetch_filter`` to cut transfer size.
+    """
+    return ["git", "-C", project["path"], "fetch", "--quiet"]
+
+
+def prefetch(project, sha=None):
+    """Start a background fetch of the project's repo (non-blocking).
+
+    At most one prefetch per repo waits behind a running fetch; further
+    calls while one is waiting are no-ops, since it will fetch their
+    commits too.
+
+    Returns:
+        True if a prefetch was started.
+    """
+    key = _repo_key(project["path"])
+    with _state_lock:
+        if key in _pending:
+            return False
+        _pending.add(key)
+    threading.Thread(
+        target=_prefetch, args=(project, sha), name=f"prefetch-{project['name']}",
+        daemon=True,
+    ).start()
+    return True
+
+
+def fetch_upstream(project, run, env=None, timeout=300, sha=None):
+    """Fetch for a deploy, unless a prefetch already brought in sha.
+
+    Waits for a running prefetch of the same repo first.
+
+    Args:
+        run: Callable(cmd) executing the fetch (the deploy's _run_cmd).
+        sha: Commit the deploy is for; None (manual deploys) always fetches.
+
+    Returns:
+        True if git fetch ran, False if the upstream ref was already sha.
+    """
+    with _repo_lock(project["path"]):
+        configure_partial_clone(project)
+        if sha and upstream_sha(project["path"], env, timeout) == sha:
+            with _state_lock:
+                _stats["fetch_skipped"] += 1
+            return False
+        run(fetch_cmd(project))
+        return True
+
+
+def upstream_sha(repo_dir, env=None, timeout=30):
+    """Return the commit of the checkout's upstream ref, or None."""
+    try:
+        result = subprocess.run(
+            ["git", "-C", repo_dir, "rev-parse", "--verify", "--quiet", "@{u}"],
+            capture_output=True, text=True, env=env, timeout=timeout,
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    if result.returncode != 0:
+        return None
+    return result.stdout.strip() or None
+
+
+def configure_partial_clone(project):
+    """Make fetches of the repo partial (``fetch_filter``, e.g. blob:none).
+
+    Marks origin as a promisor remote with that filter, the same settings
+    ``git clone --filter`` writes, so later fetches skip the filtered
+    objects and fetch them lazily on checkout.
+    """
+    fetch_filter = project.get("fetch_filter")
+    repo_dir = project["path"]
+    key = _repo_key(repo_dir)
+    if not fetch_filter or _configured.get(key) == fetch_filter:
+        return
+    for key, value in (("remote.origin.promisor", "true"),
+                       ("remote.origin.partialclonefilter", fetch_filter)):
+        subprocess.run(["git", "-C", repo_dir, "config", key, value],
+                       capture_output=True, timeout=30, check=True)
+    _configured[key] = fetch_filter
+    logger.info("Configured %s for partial fetches (%s)", project["name"], fetch_filter)
+
+
+def stats():
+    with _state_lock:
+        return dict(_stats)
+
+
+def _repo_key(path):
+    """Canonical form of a checkout path (trailing slashes, symlinks resolved)."""
+    return os.path.realpath(path)
+
+
+def _repo_lock(path):
+    with _state_lock:
+        return _locks.setdefault(_repo_key(path), threading.Lock())
+
+
+def _prefetch(project, sha):
+    path = project["path"]
+    timeout = project.get("timeout", 300)
+    with _repo_lock(path):
+        with _state_lock:
+            _pending.discard(_repo_key(path))
+        if sha and upstream_sha(path, timeout=timeout) == sha:
+            return
+        start = time.monotonic()
+        try:
+            configure_partial_clone(project)
+            returncode = stream_cmd(limit_cmd(fetch_cmd(project), project.get("resources")),
+                                    timeout=timeout, on_line=logger.debug)
+        except (OSError, subprocess.SubprocessError) as e:
+            returncode = e
+        with _state_lock:
+            _stats["prefetches"] += 1
+            if returncode != 0:
+                _stats["prefetch_failures"] += 1
+    if returncode != 0:
+        logger.warning("Prefetch of %s failed: %s", project["name"], returncode)
+    else:
+        logger.info("Prefetched %s in %.2fs", project["name"], time.monotonic() - start)
+
+
+class RepoMaintainer:
+    """Runs git maintenance on each repo once per interval, when idle.
+
+    Args:
+        get_projects: Callable returning the current project list.
+        is_idle: Callable returning True while no deploy runs or waits.
+        interval: Seconds between maintenance runs of one repo.
+        idle: Seconds the deployer must have been idle before starting.
+    """
+
+    def __init__(self, get_projects, is_idle, interval=DEFAULT_MAINTENANCE_INTERVAL,
+                 idle=DEFAULT_MAINTENANCE_IDLE):
+        self._get_projects = get_projects
+        self._is_idle = is_idle
+        self.interval = interval
+        self.idle = idle
+        self._last_run = {}  # repo path -> monotonic time of last maintenance
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name="repo-maintainer",
+                                        daemon=True)
+        self._thread.start()
+        logger.info("Repo maintenance every %ss after %ss idle", self.interval, self.idle)
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        idle_since = time.monotonic()
+        while not self._stop.wait(_MAINTENANCE_POLL):
+            if not self._is_idle():
+                idle_since = time.monotonic()
+                continue
+            if time.monotonic() - idle_since < self.idle:
+                continue
+            for project in self._due():
+                # A deploy may have started meanwhile: stop until idle again
+                if self._stop.is_set() or not self._is_idle():
+                    break
+                self.run(project)
+
+    def _due(self):
+        now = time.monotonic()
+        seen = set()
+        due = []
+        for project in self._get_projects():
+            path = _repo_key(project["path"])
+            if (path in seen or not is_git_managed(project)
+                    or not project.get("maintenance", True)):
+                continue
+            seen.add(path)
+            last = self._last_run.get(path)
+            if last is None or now - last >= self.interval:
+                due.append(project)
+        return due
+
+    def run(self, project):
+        """Maintain one repo now (commit-graph, gc --auto, partial clone setup)."""
+        path = project["path"]
+        self._last_run[_repo_key(path)] = time.monotonic()
+        start = time.monotonic()
+        try:
+            with _repo_lock(path):
+                configure_partial_clone(project)
+                for args in (["commit-graph", "write", "--reachable", "--changed-paths"],
+                             ["gc", "--auto", "--quiet"]):
+                    cmd = limit_cmd(["git", "-C", path, *args], _MAINTENANCE_LIMITS)
+                    returncode = stream_cmd(cmd, timeout=project.get("timeout", 300) * 4,
+                                            on_line=logger.debug)
+                    if returncode != 0:
+                        raise RuntimeError(f"git {args[0]} exited {returncode}")
+        except (OSError, RuntimeError, subprocess.SubprocessError) as e:
+            with _state_lock:
+                _stats["maintenance_failures"] += 1
+            logger.warning("Maintenance of %s failed: %s", project["name"], e)
+            return False
+        with _state_lock:
+            _stats["maintenance_runs"] += 1
+        logger.info("Maintained %s in %.1fs", project["name"], time.monotonic() - start)
+        return True
@@ -1,42 +1,173 @@
 """Health check logic for pi-deployer."""
 
+import json
 import logging
+import random
+import socket
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import requests
+from requests.adapters import HTTPAdapter
 
 logger = logging.getLogger("pi-deployer")
 
+DEFAULT_TIMEOUT = 10
+DEFAULT_MAX_INTERVAL = 30
 
-def run_health_check(url, retries=3, interval=5):
-    """Check if a URL responds with 2xx, with retries.
+# Shared keep-alive session so retries and repeat checks reuse connections
+_session = requests.Session()
+_session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+
+
+def run_health_checks(hc):
+    """Probe every configured target concurrently until all are healthy.
+
+    Each target retries independently with the configured backoff. The check
+    returns as soon as every target has passed, or as soon as one target
+    runs out of attempts or the overall deadline passes.
 
     Args:
-        url: URL to check.
-        retries: Number of attempts.
-        interval: Seconds between retries.
+        hc: The project's health_check config. Recognised keys:
+            url / urls: a target or list of targets. A target is a URL
+                string, or a dict with "url" (HTTP) or "tcp" ("host:port"),
+                and optionally "expect_status", "expect_body",
+                "json_field" (dotted path) and "json_value".
+            retries: Attempts per target (default 3).
+            interval: Base delay between attempts in seconds (default 5).
+            backoff: "fixed" (default), "exponential" or "jitter".
+            max_interval: Upper bound for backoff delays (default 30).
+            deadline: Total seconds allowed for the whole check (optional).
+            timeout: Per-probe timeout in seconds (default 10).
 
     Returns:
-        True if healthy, False otherwise.
+        dict with "healthy" (bool), "duration" (float) and "targets", a list
+        of per-target dicts with "target", "healthy", "attempts",
+        "elapsed" and "error".
     """
+    targets = _targets(hc)
+    start = time.monotonic()
+    if not targets:
+        return {"healthy": True, "duration": 0.0, "targets": []}
+
+    deadline = hc.get("deadline")
+    deadline_at = start + float(deadline) if deadline else None
+    stop = threading.Event()
+    results = []
+
+    with ThreadPoolExecutor(max_workers=len(targets),
+                            thread_name_prefix="health") as pool:
+        futures = [pool.submit(_check_target, t, hc, start, deadline_at, stop)
+                   for t in targets]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if not result["healthy"]:
+                stop.set()  # One target failed: the deploy is unhealthy anyway
+
+    healthy = all(r["healthy"] for r in results)
+    duration = time.monotonic() - start
+    if healthy:
+        logger.info("Health check passed for %d target(s) in %.1fs", len(targets), duration)
+    else:
+        logger.error("Health check failed after %.1fs", duration)
+    return {"healthy": healthy, "duration": duration, "targets": results}
+
+
+def _targets(hc):
+    targets = list(hc.get("urls") or [])
+    if hc.get("url"):
+        targets.insert(0, hc["url"])
+    return [t if isinstance(t, dict) else {"url": t} for t in targets]
+
+
+def _check_target(target, hc, start, deadline_at, stop):
+    label = target.get("url") or f"tcp://{target.get('tcp', '')}"
+    retries = max(1, int(hc.get("retries", 3)))
+    interval = float(hc.get("interval", 5))
+    timeout = float(hc.get("timeout", DEFAULT_TIMEOUT))
+    error = None
+
     for attempt in range(1, retries + 1):
+        probe_timeout = timeout
+        if deadline_at is not None:
+            probe_timeout = min(timeout, max(0.1, deadline_at - time.monotonic()))
+        error = _probe(target, probe_timeout)
+        if error is None:
+            logger.info("Health check passed: %s (attempt %d)", label, attempt)
+            return _target_result(label, True, attempt, start, None)
+        logger.warning("Health check %s failed (attempt %d/%d): %s",
+                       label, attempt, retries, error)
+
+        if attempt == retries:
+            break
+        delay = _delay(hc, interval, attempt)
+        if deadline_at is not None and time.monotonic() + delay >= deadline_at:
+            error = f"deadline exceeded: {error}"
+            break
+        if stop.wait(delay):
+            error = f"aborted: {error}"
+            break
+
+    return _target_result(label, False, attempt, start, error)
+
+
+def _target_result(label, healthy, attempts, start, error):
+    return {
+        "target": label,
+        "healthy": healthy,
+        "attempts": attempts,
+        "elapsed": round(time.monotonic() - start, 3),
+        "error": error,
+    }
+
+
+def _delay(hc, interval, attempt):
+    """Delay before the next attempt according to the backoff strategy."""
+    strategy = hc.get("backoff", "fixed")
+    max_interval = float(hc.get("max_interval", DEFAULT_MAX_INTERVAL))
+    if strategy == "exponential":
+        return min(max_interval, interval * (2 ** (attempt - 1)))
+    if strategy == "jitter":
+        # "Full jitter": uniform between 0 and the exponential delay
+        return random.uniform(0, min(max_interval, interval * (2 ** (attempt - 1))))
+    return interval
+
+
+def _probe(target, timeout):
+    """Run one probe. Returns None when healthy, otherwise an error string."""
+    if "tcp" in target:
+        host, _, port = str(target["tcp"]).rpartition(":")
+        try:
+            with socket.create_connection((host or "localhost", int(port)), timeout=timeout):
+                return None
+        except (OSError, ValueError) as e:
+            return str(e)
+
+    try:
+        resp = _session.get(target["url"], timeout=timeout)
+    except requests.RequestException as e:
+        return str(e)
+
+    expected = target.get("expect_status")
+    if expected is None:
+        if not 200 <= resp.status_code < 300:
+            return f"status {resp.status_code}"
+    elif resp.status_code not in (expected if isinstance(expected, list) else [expected]):
+        return f"status {resp.status_code}, expected {expected}"
+
+    if "expect_body" in target and target["expect_body"] not in resp.text:
+        return f"body does not contain {target['expect_body']!r}"
+
+    if "json_field" in target:
         try:
-            resp = requests.get(url, timeout=10)
-            if 200 <= resp.status_code < 300:
-                logger.info("Health check passed: %s (attempt %d)", url, attempt)
-                return True
-            logger.warning(
-                "Health check %s returned %d (attempt %d/%d)",
-                url, resp.status_code, attempt, retries,
-            )
-        except requests.RequestException as e:
-            logger.warning(
-                "Health check %s failed (attempt %d/%d): %s",
-                url, attempt, retries, e,
-            )
-
-        if attempt < retries:
-            time.sleep(interval)
-
-    logger.error("Health check failed after %d attempts: %s", retries, url)
-    return False
+            value = resp.json()
+            for part in str(target["json_field"]).split("."):
+                value = value[int(part)] if isinstance(value, list) else value[part]
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            return f"JSON field {target['json_field']} missing: {e}"
+        if "json_value" in target and value != target["json_value"]:
+            return f"JSON field {target['json_field']} is {json.dumps(value)}"
+    return None
@@ -0,0 +1,247 @@
+"""Persistent deploy history for pi-deployer.
+
+Every finished deploy is stored as one row in a SQLite database
+(HISTORY_DB, default STATE_DIR/history.db) in WAL mode, so readers never
+block the writer. Rows are written by a single background thread; deploy
+threads only put the record on a bounded queue and never wait for disk.
+"""
+
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+
+logger = logging.getLogger("pi-deployer")
+
+DEFAULT_MAX_QUEUE = 1000
+_BATCH_SIZE = 50
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS deploys (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    project TEXT NOT NULL,
+    deploy_id INTEGER,
+    trigger TEXT,
+    commit_sha TEXT,
+    status TEXT NOT NULL,
+    started_at TEXT,
+    finished_at TEXT,
+    duration REAL,
+    stages TEXT,
+    rolled_back_to TEXT,
+    error TEXT,
+    resources TEXT
+);
+CREATE INDEX IF NOT EXISTS deploys_project_started ON deploys (project, started_at);
+CREATE INDEX IF NOT EXISTS deploys_started ON deploys (started_at);
+"""
+
+_COLUMNS = ("project", "deploy_id", "trigger", "commit_sha", "status", "started_at",
+            "finished_at", "duration", "stages", "rolled_back_to", "error", "resources")
+_JSON_COLUMNS = ("stages", "resources")
+
+
+class HistoryStore:
+    """SQLite-backed deploy history with a non-blocking write path.
+
+    Args:
+        path: Database file; created (with its directory) if missing.
+        max_queue: Records buffered for the writer thread; beyond that new
+            records are dropped with a warning rather than blocking a deploy.
+    """
+
+    def __init__(self, path, max_queue=DEFAULT_MAX_QUEUE):
+        self.path = path
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._local = threading.local()
+        self._latest_lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        conn.executescript(_SCHEMA)
+        self._latest = self._load_latest(conn)
+
+        self._writer = threading.Thread(target=self._write_loop, name="history-writer",
+                                        daemon=True)
+        self._writer.start()
+
+    def record(self, entry):
+        """Queue a finished deploy for storage and update the latest cache.
+
+        Args:
+            entry: dict with the keys in _COLUMNS; "stages" and "resources"
+                may be a list / dict.
+        """
+        row = {key: entry.get(key) for key in _COLUMNS}
+        for key in _JSON_COLUMNS:
+            if not isinstance(row[key], (str, type(None))):
+                row[key] = json.dumps(row[key])
+        with self._latest_lock:
+            self._latest[row["project"]] = _row_to_dict(row)
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+            logger.warning("History queue full, dropped record for %s", row["project"])
+
+    def latest(self, project):
+        """Return the most recent deploy of a project (dict) or None."""
+        with self._latest_lock:
+            return self._latest.get(project)
+
+    def query(self, project=None, status=None, since=None, until=None,
+              limit=50, offset=0):
+        """Return past deploys, newest first.
+
+        Args:
+            project: Only this project.
+            status: Only this outcome (success, failed, skipped, ...).
+            since / until: ISO timestamps bounding started_at.
+            limit / offset: Paging.
+
+        Returns:
+            (total matching rows, list of deploy dicts)
+        """
+        where, params = _filters(project, status, since, until)
+        conn = self._connect()
+        total = conn.execute(f"SELECT COUNT(*) FROM deploys{where}", params).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT {', '.join(_COLUMNS)} FROM deploys{where} "
+            "ORDER BY started_at DESC, id DESC LIMIT ? OFFSET ?",
+            params + [limit, offset],
+        ).fetchall()
+        return total, [_row_to_dict(dict(zip(_COLUMNS, r))) for r in rows]
+
+    def stats(self, project=None, since=None, until=None):
+        """Per-project aggregates: deploy count, failure rate, p50/p95 duration.
+
+        Skipped deploys are counted but left out of the duration percentiles.
+        """
+        where, params = _filters(project, None, since, until)
+        conn = self._connect()
+        rows = conn.execute(
+            f"SELECT project, status, duration FROM deploys{where} "
+            "ORDER BY project, duration",
+            params,
+        ).fetchall()
+
+        by_project = {}
+        for name, status, duration in rows:
+            by_project.setdefault(name, []).append((status, duration))
+
+        result = {}
+        for name, entries in by_project.items():
+            failures = sum(1 for s, _ in entries if s not in ("success", "skipped"))
+            durations = sorted(d for s, d in entries if s != "skipped" and d is not None)
+            result[name] = {
+                "deploys": len(entries),
+                "failures": failures,
+                "skipped": sum(1 for s, _ in entries if s == "skipped"),
+                "failure_rate": round(failures / len(entries), 3),
+                "p50_duration": _percentile(durations, 50),
+                "p95_duration": _percentile(durations, 95),
+                "avg_duration": round(sum(durations) / len(durations), 3)
+                if durations else None,
+            }
+        return result
+
+    def flush(self, timeout=None):
+        """Wait until every queued record has been written."""
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def _connect(self):
+        """Return this thread's connection (SQLite connections are per-thread)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _load_latest(self, conn):
+        latest = {}
+        rows = conn.execute(
+            f"SELECT {', '.join(_COLUMNS)} FROM deploys WHERE id IN "
+            "(SELECT MAX(id) FROM deploys GROUP BY project)"
+        ).fetchall()
+        for r in rows:
+            entry = _row_to_dict(dict(zip(_COLUMNS, r)))
+            latest[entry["project"]] = entry
+        return latest
+
+    def _write_loop(self):
+        conn = self._connect()
+        while True:
+            batch = [self._queue.get()]
+            # Drain whatever else is waiting so a burst becomes one transaction
+            while len(batch) < _BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            rows = [item for item in batch if isinstance(item, dict)]
+            if rows:
+                try:
+                    with conn:
+                        conn.executemany(
+                            f"INSERT INTO deploys ({', '.join(_COLUMNS)}) "
+                            f"VALUES ({', '.join('?' * len(_COLUMNS))})",
+                            [tuple(row[key] for key in _COLUMNS) for row in rows],
+                        )
+                except sqlite3.Error as e:
+                    logger.error("Failed to write %d history record(s): %s", len(rows), e)
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+
+
+def _filters(project, status, since, until):
+    clauses, params = [], []
+    if project:
+        clauses.append("project = ?")
+        params.append(project)
+    if status:
+        clauses.append("status = ?")
+        params.append(status)
+    if since:
+        clauses.append("started_at >= ?")
+        params.append(since)
+    if until:
+        clauses.append("started_at < ?")
+        params.append(until)
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+
+def _row_to_dict(row):
+    entry = dict(row)
+    if isinstance(entry.get("stages"), str):
+        try:
+            entry["stages"] = json.loads(entry["stages"])
+        except ValueError:
+            entry["stages"] = []
+    if isinstance(entry.get("resources"), str):
+        try:
+            entry["resources"] = json.loads(entry["resources"])
+        except ValueError:
+            entry["resources"] = None
+    return entry
+
+
+def _percentile(values, pct):
+    """Nearest-rank percentile of an already sorted list (None if empty)."""
+    if not values:
+        return None
+    rank = max(1, -(-len(values) * pct // 100))  # ceil without floats
+    return round(values[int(rank) - 1], 3)
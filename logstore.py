@@ -0,0 +1,239 @@
+"""Per-project deploy log files: streaming writes, tail reads, rotation and index.
+
+Layout inside LOG_DIR for a project ``name``:
+
+    name.log           active segment, deploy entries appended in order
+    name.log.<gen>.gz  rotated, compressed older segments
+    name.idx           one JSON line per finished deploy:
+                       {"id", "gen", "offset", "length", "status", ...}
+
+The index lets any past deploy be read with a single seek into its segment
+instead of scanning the log.
+"""
+
+import gzip
+import json
+import logging
+import os
+import shutil
+import threading
+from datetime import datetime, timezone
+
+logger = logging.getLogger("pi-deployer")
+
+DEFAULT_MAX_BYTES = 5 * 1024 * 1024  # 5 MB
+DEFAULT_BACKUP_COUNT = 5
+_BLOCK_SIZE = 8192
+
+
+def log_paths(log_dir, name):
+    """Return (log_file, index_file) paths for a project."""
+    return (
+        os.path.join(log_dir, f"{name}.log"),
+        os.path.join(log_dir, f"{name}.idx"),
+    )
+
+
+class DeployLogWriter:
+    """Appends one deploy entry to a project log as output is produced.
+
+    Rotates the active segment before starting if it grew past the size
+    limit, and records the entry in the index when closed.
+    """
+
+    def __init__(self, log_dir, name):
+        self._name = name
+        self._log_file, self._index_file = log_paths(log_dir, name)
+        self._lock = threading.Lock()
+
+        last = _last_index_record(self._index_file)
+        self.deploy_id = (last["id"] + 1) if last else 1
+        self._gen = _current_gen(self._log_file)
+        if _file_size(self._log_file) >= _max_bytes():
+            self._gen = _rotate(self._log_file, self._index_file, self._gen)
+
+        self._started = datetime.now(timezone.utc).isoformat()
+        self._file = open(self._log_file, "ab")
+        self._offset = self._file.tell()
+        self._write(
+            f"\n{'=' * 60}\n"
+            f"[{self._started}] {name} - started (deploy #{self.deploy_id})\n"
+            f"{'=' * 60}\n"
+        )
+
+    def write(self, line):
+        with self._lock:
+            if not self._file.closed:
+                self._write(line + "\n")
+
+    def close(self, status, duration):
+        """Write the result footer, close the file and index the entry (idempotent)."""
+        with self._lock:
+            if self._file.closed:
+                return
+            timestamp = datetime.now(timezone.utc).isoformat()
+            self._write(f"[{timestamp}] {self._name} - {status} ({duration:.1f}s)\n")
+            length = self._file.tell() - self._offset
+            self._file.close()
+
+        record = {
+            "id": self.deploy_id,
+            "gen": self._gen,
+            "offset": self._offset,
+            "length": length,
+            "started": self._started,
+            "status": status,
+            "duration": round(duration, 3),
+        }
+        with open(self._index_file, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def _write(self, text):
+        self._file.write(text.encode("utf-8", errors="replace"))
+        self._file.flush()
+
+
+def tail_lines(path, limit=50, offset=0):
+    """Return up to ``limit`` lines ending ``offset`` lines before EOF.
+
+    Reads backwards from the end of the file in fixed-size blocks, so the
+    cost depends on the amount requested, not on the file size.
+    """
+    if limit <= 0:
+        return []
+    wanted = limit + offset
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return []
+    with f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        data = b""
+        # One extra newline so the first returned line is complete
+        while pos > 0 and data.count(b"\n") <= wanted:
+            step = min(_BLOCK_SIZE, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+
+    lines = data.decode("utf-8", errors="replace").splitlines()
+    if pos > 0:
+        lines = lines[1:]
+    end = len(lines) - offset
+    if end <= 0:
+        return []
+    return lines[max(0, end - limit):end]
+
+
+def last_deploy(log_dir, name):
+    """Return the index record of the project's most recent finished deploy."""
+    return _last_index_record(log_paths(log_dir, name)[1])
+
+
+def read_deploy(log_dir, name, deploy_id):
+    """Return (index record, lines) for a past deploy, or None if unknown."""
+    log_file, index_file = log_paths(log_dir, name)
+    record = None
+    try:
+        with open(index_file, "r") as f:
+            for raw in f:
+                entry = _parse_record(raw)
+                if entry and entry["id"] == deploy_id:
+                    record = entry
+                    break
+    except FileNotFoundError:
+        return None
+    if record is None:
+        return None
+
+    segment = _segment_path(log_file, record["gen"])
+    if os.path.exists(segment):
+        opener, path = gzip.open, segment
+    else:
+        opener, path = open, log_file
+    try:
+        with opener(path, "rb") as f:
+            f.seek(record["offset"])
+            data = f.read(record["length"])
+    except FileNotFoundError:
+        return None
+    return record, data.decode("utf-8", errors="replace").strip("\n").splitlines()
+
+
+def _rotate(log_file, index_file, gen):
+    """Compress the active segment, prune old ones, and return the new generation."""
+    segment = _segment_path(log_file, gen)
+    with open(log_file, "rb") as src, gzip.open(segment, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(log_file)
+
+    keep_from = gen + 1 - _backup_count()
+    for old in _segment_gens(log_file):
+        if old < keep_from:
+            os.remove(_segment_path(log_file, old))
+
+    if os.path.exists(index_file):
+        tmp = index_file + ".tmp"
+        with open(index_file, "r") as src, open(tmp, "w") as dst:
+            for raw in src:
+                entry = _parse_record(raw)
+                if entry and entry["gen"] >= keep_from:
+                    dst.write(raw)
+        os.replace(tmp, index_file)
+
+    logger.info("Rotated %s into %s", log_file, segment)
+    return gen + 1
+
+
+def _last_index_record(index_file):
+    for raw in reversed(tail_lines(index_file, limit=5)):
+        entry = _parse_record(raw)
+        if entry:
+            return entry
+    return None
+
+
+def _parse_record(raw):
+    try:
+        entry = json.loads(raw)
+    except ValueError:
+        return None
+    return entry if isinstance(entry, dict) and "id" in entry else None
+
+
+def _segment_path(log_file, gen):
+    return f"{log_file}.{gen}.gz"
+
+
+def _segment_gens(log_file):
+    """Return the generations of all rotated segments of a log file."""
+    directory, base = os.path.split(log_file)
+    gens = []
+    for entry in os.listdir(directory or "."):
+        if entry.startswith(base + ".") and entry.endswith(".gz"):
+            middle = entry[len(base) + 1:-3]
+            if middle.isdigit():
+                gens.append(int(middle))
+    return gens
+
+
+def _current_gen(log_file):
+    """Generation of the active segment: one past the newest rotated segment."""
+    gens = _segment_gens(log_file)
+    return max(gens) + 1 if gens else 0
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _max_bytes():
+    return int(os.environ.get("LOG_MAX_BYTES", DEFAULT_MAX_BYTES))
+
+
+def _backup_count():
+    return int(os.environ.get("LOG_BACKUP_COUNT", DEFAULT_BACKUP_COUNT))
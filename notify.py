@@ -1,17 +1,172 @@
 """Telegram notification for pi-deployer."""
 
+import collections
 import logging
 import os
+import threading
+import time
 
 import requests
+from requests.adapters import HTTPAdapter
 
 logger = logging.getLogger("pi-deployer")
 
-TELEGRAM_API = "https://api.telegram.org/bot{token}/sendMessage"
+DEFAULT_API_BASE = "https://api.telegram.org"
+FINAL_EVENTS = {"success", "failed", "timeout"}
+
+
+class NotificationDispatcher:
+    """Delivers Telegram messages from a bounded queue on a background thread.
+
+    One keep-alive HTTP session is reused for every call. A deploy's
+    "triggered" message is sent once and later edited in place with the
+    final status, so each deploy produces a single chat message.
+
+    When the queue is full the oldest queued message is dropped; a final
+    status that arrives before its "triggered" message went out replaces it.
+
+    Args:
+        token: Bot token.
+        chat_id: Target chat.
+        api_base: Telegram API base URL (point at a local fake for tests).
+        max_queue: Maximum number of queued, unsent messages.
+        max_attempts: Attempts per message before it is given up.
+        backoff: Initial retry delay in seconds, doubled per attempt.
+        timeout: Per-request timeout in seconds.
+    """
+
+    def __init__(self, token, chat_id, api_base=DEFAULT_API_BASE, max_queue=50,
+                 max_attempts=4, backoff=1.0, timeout=10):
+        self._base = f"{api_base.rstrip('/')}/bot{token}"
+        self._chat_id = chat_id
+        self._max_queue = max_queue
+        self._max_attempts = max_attempts
+        self._backoff = backoff
+        self._timeout = timeout
+
+        self._session = requests.Session()
+        self._session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        self._session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+
+        self._cond = threading.Condition()
+        self._queue = collections.deque()  # [key, event_type, text]
+        self._busy = False
+        self._thread = None
+        self._message_ids = {}  # key -> message_id of the deploy's message
+        self.dropped = 0
+
+    def enqueue(self, key, event_type, text):
+        """Queue a message for a deploy identified by key (never blocks)."""
+        with self._cond:
+            if event_type in FINAL_EVENTS:
+                for item in reversed(self._queue):
+                    if item[0] == key:
+                        if item[1] == "triggered":
+                            item[1], item[2] = event_type, text
+                            return
+                        break
+            if len(self._queue) >= self._max_queue:
+                dropped = self._queue.popleft()
+                self.dropped += 1
+                logger.warning("Notification queue full, dropped %s message for %s",
+                               dropped[1], dropped[0])
+            self._queue.append([key, event_type, text])
+            self._ensure_thread()
+            self._cond.notify()
+
+    def flush(self, timeout=None):
+        """Wait until every queued message was handled. Returns True if drained."""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._queue and not self._busy, timeout)
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._loop, name="notify-dispatcher", daemon=True,
+            )
+            self._thread.start()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._busy = False
+                    self._cond.notify_all()
+                    self._cond.wait()
+                key, event_type, text = self._queue.popleft()
+                self._busy = True
+            try:
+                self._deliver(key, event_type, text)
+            except Exception:
+                logger.exception("Telegram notification failed")
+
+    def _deliver(self, key, event_type, text):
+        message_id = self._message_ids.pop(key, None)
+        if message_id is not None and event_type != "triggered":
+            result = self._call("editMessageText", {"message_id": message_id, "text": text})
+            if result is not None:
+                return
+            # Message gone or not editable: fall back to a new message
+
+        result = self._call("sendMessage", {"text": text})
+        if result and event_type == "triggered":
+            self._message_ids[key] = result.get("message_id")
+
+    def _call(self, method, fields):
+        """POST a Bot API method with retries. Returns the result object or None."""
+        body = {
+            "chat_id": self._chat_id,
+            "parse_mode": "HTML",
+            "disable_web_page_preview": True,
+            **fields,
+        }
+        delay = self._backoff
+        for attempt in range(1, self._max_attempts + 1):
+            try:
+                resp = self._session.post(f"{self._base}/{method}", json=body,
+                                          timeout=self._timeout)
+                if resp.ok:
+                    return resp.json().get("result") or {}
+                if resp.status_code == 429:
+                    retry_after = _retry_after(resp)
+                    delay = max(delay, retry_after) if retry_after else delay
+                elif resp.status_code < 500:
+                    logger.warning("Telegram API error: %s %s", resp.status_code, resp.text)
+                    return None
+                logger.warning("Telegram API %s returned %s (attempt %d/%d)",
+                               method, resp.status_code, attempt, self._max_attempts)
+            except requests.RequestException as e:
+                logger.warning("Telegram %s failed (attempt %d/%d): %s",
+                               method, attempt, self._max_attempts, e)
+            if attempt < self._max_attempts:
+                time.sleep(delay)
+                delay *= 2
+        return None
+
+
+_dispatcher = None
+_dispatcher_key = None
+_dispatcher_mutex = threading.Lock()
+
+
+def get_dispatcher():
+    """Return the shared dispatcher for the configured bot, or None if unset."""
+    global _dispatcher, _dispatcher_key
+    token = os.environ.get("TELEGRAM_BOT_TOKEN", "")
+    chat_id = os.environ.get("TELEGRAM_CHAT_ID", "")
+    if not token or not chat_id:
+        return None
+    api_base = os.environ.get("TELEGRAM_API_URL", DEFAULT_API_BASE)
+    key = (token, chat_id, api_base)
+    with _dispatcher_mutex:
+        if _dispatcher_key != key:
+            _dispatcher = NotificationDispatcher(token, chat_id, api_base)
+            _dispatcher_key = key
+        return _dispatcher
 
 
 def send_notification(event_type, project, commit_info=None, details=None):
-    """Send a Telegram notification.
+    """Queue a Telegram notification; returns immediately.
 
     Args:
         event_type: One of "triggered", "success", "failed", "timeout".
@@ -19,30 +174,20 @@ def send_notification(event_type, project, commit_info=None, details=None):
         commit_info: Optional dict with "message", "author", "url".
         details: Optional string with extra details (e.g. error log tail).
     """
-    token = os.environ.get("TELEGRAM_BOT_TOKEN", "")
-    chat_id = os.environ.get("TELEGRAM_CHAT_ID", "")
-
-    if not token or not chat_id:
+    dispatcher = get_dispatcher()
+    if dispatcher is None:
         logger.debug("Telegram not configured, skipping notification")
         return
 
     message = _format_message(event_type, project, commit_info, details)
+    dispatcher.enqueue(project.get("name", "unknown"), event_type, message)
+
 
+def _retry_after(resp):
     try:
-        resp = requests.post(
-            TELEGRAM_API.format(token=token),
-            json={
-                "chat_id": chat_id,
-                "text": message,
-                "parse_mode": "HTML",
-                "disable_web_page_preview": True,
-            },
-            timeout=10,
-        )
-        if not resp.ok:
-            logger.warning("Telegram API error: %s %s", resp.status_code, resp.text)
-    except requests.RequestException as e:
-        logger.warning("Telegram notification failed: %s", e)
+        return float(resp.json().get("parameters", {}).get("retry_after", 0))
+    except (ValueError, AttributeError):
+        return 0
 
 
 def _format_message(event_type, project, commit_info, details):
@@ -0,0 +1,35 @@
+"""Per-project path filters for pi-deployer.
+
+``include_paths`` and ``ignore_paths`` are lists of fnmatch globs matched
+against repo-relative paths (``*`` also matches ``/``; a pattern ending in
+``/`` matches everything below that directory). A push is relevant
+to a project when at least one changed file is included (or no
+include_paths are set) and not ignored.
+"""
+
+import fnmatch
+
+
+def has_path_filters(project):
+    return bool(project.get("include_paths") or project.get("ignore_paths"))
+
+
+def matching_paths(project, changed_files):
+    """Return the changed files that pass the project's path filters."""
+    include = _patterns(project.get("include_paths"))
+    ignore = _patterns(project.get("ignore_paths"))
+    return [
+        path for path in changed_files
+        if (not include or _matches(path, include)) and not _matches(path, ignore)
+    ]
+
+
+def _patterns(value):
+    if not value:
+        return []
+    patterns = [value] if isinstance(value, str) else value
+    return [p + "*" if p.endswith("/") else p for p in patterns]
+
+
+def _matches(path, patterns):
+    return any(fnmatch.fnmatch(path, p) for p in patterns)
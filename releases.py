@@ -0,0 +1,111 @@
+"""Last known-good release tracking and rollback for pi-deployer.
+
+After every successful deploy the checked-out commit (and, for compose
+projects, the image ID behind every service image tag) is written to
+STATE_DIR/<name>.release.json. Rolling back checks that commit out again,
+points the tags back at the recorded image IDs and restarts, without
+rebuilding anything; docker-image projects are also re-pinned to the
+images of the recorded commit.
+"""
+
+import json
+import logging
+import os
+import subprocess
+from datetime import datetime, timezone
+
+from compose import IMAGE_MODE, compose_cmd, resolve_images, write_image_override
+
+logger = logging.getLogger("pi-deployer")
+
+
+def _release_file(name):
+    state_dir = os.environ.get("STATE_DIR", "./state")
+    return os.path.join(state_dir, f"{name}.release.json")
+
+
+def load_release(name):
+    """Return the project's last known-good release dict, or None."""
+    try:
+        with open(_release_file(name), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def record_release(project, sha, env=None, timeout=60):
+    """Record sha (and the current compose images) as the known-good release."""
+    release = {
+        "sha": sha,
+        "images": {},
+        "deployed_at": datetime.now(timezone.utc).isoformat(),
+    }
+    if project.get("deploy_mode") in ("docker-compose", IMAGE_MODE):
+        release["images"] = _compose_images(project, env, timeout)
+
+    path = _release_file(project["name"])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(release, f)
+    os.replace(tmp, path)
+    return release
+
+
+def rollback(project, release, run):
+    """Restore a recorded release without rebuilding.
+
+    Args:
+        project: Merged project config dict.
+        release: Release dict from load_release.
+        run: Callable(cmd) executing a command in the repo directory.
+    """
+    repo_dir = project["path"]
+    mode = project.get("deploy_mode", "pull-only")
+    run(["git", "-C", repo_dir, "reset", "--hard", release["sha"]])
+
+    if mode in ("docker-compose", IMAGE_MODE):
+        if mode == IMAGE_MODE:
+            write_image_override(project, resolve_images(project, release["sha"]))
+        for ref, image_id in sorted(release.get("images", {}).items()):
+            run(["docker", "tag", image_id, ref])
+        run(compose_cmd(project, "up", "-d", "--no-build"))
+    elif mode == "systemd":
+        run(["sudo", "systemctl", "restart", project.get("service_name", project["name"])])
+    logger.info("Rolled back %s to %s", project["name"], release["sha"])
+
+
+def _compose_images(project, env, timeout):
+    """Map "repository:tag" -> image ID for the project's compose services."""
+    try:
+        result = subprocess.run(
+            compose_cmd(project, "images", "--format", "json"),
+            capture_output=True, text=True, env=env, timeout=timeout,
+            cwd=project["path"],
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.warning("Could not list compose images for %s: %s", project["name"], e)
+        return {}
+    if result.returncode != 0:
+        logger.warning("Could not list compose images for %s: %s",
+                       project["name"], result.stderr.strip())
+        return {}
+
+    # Newer compose prints one JSON array, older versions one object per line
+    try:
+        entries = json.loads(result.stdout or "[]")
+    except ValueError:
+        try:
+            entries = [json.loads(line) for line in result.stdout.splitlines() if line.strip()]
+        except ValueError:
+            logger.warning("Unexpected compose images output for %s", project["name"])
+            return {}
+    if isinstance(entries, dict):
+        entries = [entries]
+
+    images = {}
+    for entry in entries:
+        repo, tag, image_id = entry.get("Repository"), entry.get("Tag"), entry.get("ID")
+        if repo and repo != "<none>" and image_id:
+            images[f"{repo}:{tag or 'latest'}"] = image_id
+    return images
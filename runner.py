@@ -0,0 +1,285 @@
+"""Streaming subprocess execution for pi-deployer.
+
+Every command runs in its own session (process group) so a timeout or a
+CancelToken kills the whole tree. It is optionally wrapped in nice /
+ionice / a systemd scope with CPU and memory limits, and is reaped with
+wait4 to collect its resource usage.
+"""
+
+import collections
+import logging
+import os
+import shutil
+import signal
+import subprocess
+import threading
+
+logger = logging.getLogger("pi-deployer")
+
+DEFAULT_TAIL_LINES = 200
+MAX_LINE_LENGTH = 4000
+
+
+class OutputTail:
+    """Bounded ring buffer holding the most recent output lines of a deploy.
+
+    Safe to read from other threads while the deploy is still appending.
+    """
+
+    def __init__(self, maxlen=DEFAULT_TAIL_LINES):
+        self._lines = collections.deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    def append(self, line):
+        with self._lock:
+            self._lines.append(line)
+
+    def lines(self):
+        with self._lock:
+            return list(self._lines)
+
+    def text(self):
+        return "\n".join(self.lines())
+
+
+class CommandCancelled(Exception):
+    """Raised by stream_cmd when the command was stopped through its CancelToken."""
+
+
+class CancelToken:
+    """Stops every command started with it, from any thread.
+
+    Commands started after cancel() are not run at all.
+    """
+
+    def __init__(self):
+        self.cancelled = False
+        self._stoppers = set()
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            stoppers = list(self._stoppers)
+        for stop in stoppers:
+            stop()
+
+    def _register(self, stop):
+        with self._lock:
+            if self.cancelled:
+                return False
+            self._stoppers.add(stop)
+            return True
+
+    def _unregister(self, stop):
+        with self._lock:
+            self._stoppers.discard(stop)
+
+
+class ResourceUsage:
+    """Resource usage summed over the commands of one deploy.
+
+    CPU time and block I/O include every descendant the command waited for;
+    peak RSS is that of the largest single process. Work done by daemons
+    (e.g. image builds inside dockerd) is not included.
+    """
+
+    def __init__(self):
+        self.cpu_user = 0.0
+        self.cpu_system = 0.0
+        self.max_rss_kb = 0
+        self.read_bytes = 0
+        self.write_bytes = 0
+        self.commands = 0
+        self._lock = threading.Lock()
+
+    def add(self, rusage):
+        with self._lock:
+            self.cpu_user += rusage.ru_utime
+            self.cpu_system += rusage.ru_stime
+            self.max_rss_kb = max(self.max_rss_kb, rusage.ru_maxrss)
+            self.read_bytes += rusage.ru_inblock * 512
+            self.write_bytes += rusage.ru_oublock * 512
+            self.commands += 1
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "commands": self.commands,
+                "cpu_user": round(self.cpu_user, 3),
+                "cpu_system": round(self.cpu_system, 3),
+                "max_rss_mb": round(self.max_rss_kb / 1024, 1),
+                "read_mb": round(self.read_bytes / 1048576, 1),
+                "write_mb": round(self.write_bytes / 1048576, 1),
+            }
+
+    def summary(self):
+        u = self.as_dict()
+        return (f"{u['commands']} command(s), CPU {u['cpu_user']:.1f}s user / "
+                f"{u['cpu_system']:.1f}s system, peak RSS {u['max_rss_mb']:.0f}MB, "
+                f"read {u['read_mb']:.1f}MB, written {u['write_mb']:.1f}MB")
+
+
+def limit_cmd(cmd, limits):
+    """Wrap cmd to run with the project's ``resources`` settings.
+
+    Recognised keys: ``nice`` (niceness, e.g. 10), ``ionice`` ("idle" or
+    "best-effort[:level]"), ``cpu_quota`` (systemd CPUQuota, e.g. "50%")
+    and ``memory_max`` (systemd MemoryMax, e.g. "512M"). CPU and memory
+    limits use a transient ``systemd-run --user --scope``. Tools that are
+    not installed, or a user manager that cannot be reached, are skipped
+    with a warning.
+    """
+    if not limits:
+        return cmd
+    prefix = []
+
+    properties = []
+    if limits.get("cpu_quota"):
+        properties += ["-p", f"CPUQuota={limits['cpu_quota']}"]
+    if limits.get("memory_max"):
+        properties += ["-p", f"MemoryMax={limits['memory_max']}"]
+    if properties:
+        if _user_scopes_available():
+            prefix += ["systemd-run", "--user", "--scope", "--quiet", *properties, "--"]
+        else:
+            logger.warning("systemd-run --user unavailable, ignoring cpu_quota / memory_max")
+
+    if limits.get("nice") is not None:
+        prefix += ["nice", "-n", str(int(limits["nice"]))]
+
+    if limits.get("ionice"):
+        if shutil.which("ionice"):
+            io_class, _, level = str(limits["ionice"]).partition(":")
+            if io_class == "idle":
+                prefix += ["ionice", "-c", "3"]
+            elif io_class == "best-effort":
+                prefix += ["ionice", "-c", "2", "-n", level or "7"]
+            else:
+                logger.warning("Unsupported ionice class %r", io_class)
+        else:
+            logger.warning("ionice not found, ignoring ionice setting")
+
+    return prefix + list(cmd)
+
+
+_user_scopes = None
+_user_scopes_lock = threading.Lock()
+
+
+def _user_scopes_available():
+    """Whether ``systemd-run --user --scope`` works here (checked once).
+
+    A system service (the shipped unit runs as ``User=pie``) only has a
+    user manager to talk to when lingering is enabled for that user.
+    """
+    global _user_scopes
+    with _user_scopes_lock:
+        if _user_scopes is None:
+            _user_scopes = False
+            if shutil.which("systemd-run"):
+                try:
+                    result = subprocess.run(
+                        ["systemd-run", "--user", "--scope", "--quiet", "true"],
+                        capture_output=True, text=True, timeout=10,
+                    )
+                    _user_scopes = result.returncode == 0
+                    if not _user_scopes:
+                        logger.warning("systemd-run --user failed (is lingering enabled "
+                                       "for this user?): %s", result.stderr.strip())
+                except (OSError, subprocess.TimeoutExpired) as e:
+                    logger.warning("systemd-run --user failed: %s", e)
+        return _user_scopes
+
+
+def stream_cmd(cmd, env=None, timeout=300, cwd=None, on_line=None, usage=None,
+               cancel=None):
+    """Run a command and hand each output line to on_line as it arrives.
+
+    stdout and stderr are merged so lines keep their original order. Nothing
+    is accumulated here; callers decide what to keep.
+
+    Args:
+        cmd: Command argument list.
+        env: Environment for the child process.
+        timeout: Seconds before the process is killed.
+        cwd: Working directory.
+        on_line: Callable receiving each line (without trailing newline).
+        usage: Optional ResourceUsage the command's rusage is added to.
+        cancel: Optional CancelToken; cancelling it kills the command.
+
+    Returns:
+        The process exit code.
+
+    Raises:
+        subprocess.TimeoutExpired: If the command ran longer than timeout.
+    """
+    if cancel is not None and cancel.cancelled:
+        raise CommandCancelled(cmd)
+    proc = subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        stdin=subprocess.DEVNULL,
+        env=env,
+        cwd=cwd,
+        text=True,
+        encoding="utf-8",
+        errors="replace",
+        bufsize=1,
+        start_new_session=True,  # own process group, so the whole tree can be killed
+    )
+
+    timed_out = threading.Event()
+    cancelled = threading.Event()
+    reap_lock = threading.Lock()
+
+    def _stop(reason):
+        with reap_lock:
+            if proc.returncode is None:
+                reason.set()
+                _kill_group(proc)
+
+    def _cancel():
+        _stop(cancelled)
+
+    timer = threading.Timer(timeout, _stop, (timed_out,))
+    timer.daemon = True
+    timer.start()
+    if cancel is not None and not cancel._register(_cancel):
+        _cancel()
+    try:
+        for raw in proc.stdout:
+            line = raw.rstrip("\r\n")[:MAX_LINE_LENGTH]
+            if on_line:
+                on_line(line)
+        _, status, rusage = os.wait4(proc.pid, 0)
+        with reap_lock:
+            proc.returncode = os.waitstatus_to_exitcode(status)
+        if usage is not None:
+            usage.add(rusage)
+    except BaseException:
+        with reap_lock:
+            if proc.returncode is None:
+                _kill_group(proc)
+        proc.wait()
+        raise
+    finally:
+        timer.cancel()
+        if cancel is not None:
+            cancel._unregister(_cancel)
+        proc.stdout.close()
+
+    if cancelled.is_set():
+        raise CommandCancelled(cmd)
+    if timed_out.is_set():
+        raise subprocess.TimeoutExpired(cmd, timeout)
+    return proc.returncode
+
+
+def _kill_group(proc):
+    """SIGKILL the process group led by proc (falls back to proc alone)."""
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        proc.kill()
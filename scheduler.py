@@ -0,0 +1,262 @@
+"""Bounded, resource-aware deploy scheduler for pi-deployer.
+
+A fixed pool of worker threads runs deploys from a single queue. Each project
+has at most one queued job (newer pushes replace the queued commit) and never
+runs twice at once, and projects sharing a checkout (same resolved path)
+never run at the same time. Jobs are admitted by priority while their weight fits in
+the global capacity; heavy jobs (weight > 1) additionally wait for the load
+average and free memory to be under the configured thresholds.
+"""
+
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger("pi-deployer")
+
+_IDLE_POLL = 1.0  # seconds between re-checks while jobs wait on time/resources
+
+
+class _Job:
+    __slots__ = ("project", "commit_info", "force", "enqueued_at", "ready_at", "started_at")
+
+    def __init__(self, project, commit_info, force, now):
+        self.project = project
+        self.commit_info = commit_info
+        self.force = force
+        self.enqueued_at = now
+        self.ready_at = now + float(project.get("debounce", 0) or 0)
+        self.started_at = None
+
+    @property
+    def name(self):
+        return self.project["name"]
+
+    @property
+    def checkout(self):
+        return os.path.realpath(self.project["path"])
+
+    @property
+    def priority(self):
+        return int(self.project.get("priority", 0))
+
+    @property
+    def weight(self):
+        return max(1, int(self.project.get("weight", 1)))
+
+
+class DeployScheduler:
+    """Runs deploy jobs on a bounded worker pool.
+
+    Args:
+        run_job: Callable(project, commit_info, force) executing one deploy.
+        concurrency: Global capacity in weight units (and worker threads).
+        max_load: Heavy jobs wait while the 1-minute load average is above this.
+        min_free_mb: Heavy jobs wait while MemAvailable is below this (MB).
+        admission_timeout: Seconds after which a waiting heavy job is admitted
+            regardless of load, so it cannot starve.
+    """
+
+    def __init__(self, run_job, concurrency=2, max_load=None, min_free_mb=None,
+                 admission_timeout=600):
+        self._run_job = run_job
+        self.concurrency = max(1, int(concurrency))
+        self._max_load = max_load
+        self._min_free_mb = min_free_mb
+        self._admission_timeout = admission_timeout
+
+        self._cond = threading.Condition()
+        self._queued = {}   # name -> _Job waiting to start
+        self._running = {}  # name -> _Job in progress
+        self._used = 0
+        self._workers = []
+        self._deferred_reason = {}  # name -> why the job is still waiting
+        self._started_count = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._closing = False
+
+    def submit(self, project, commit_info, force=False):
+        """Queue a deploy for a project.
+
+        A forced submit keeps the queued job forced even if a later,
+        unforced push replaces its commit.
+
+        Returns:
+            "accepted" for a new job, "queued" if it replaced the commit of
+            a job already waiting behind a running deploy of the project, or
+            "rejected" once shutdown() has been called.
+        """
+        name = project["name"]
+        with self._cond:
+            if self._closing:
+                logger.warning("Scheduler shutting down, not queueing deploy for %s", name)
+                return "rejected"
+            self._ensure_workers()
+            job = self._queued.get(name)
+            if job:
+                job.project = project
+                job.commit_info = commit_info
+                job.force = job.force or force
+                logger.info("Deploy for %s already queued, replaced commit", name)
+                return "queued"
+            self._queued[name] = _Job(project, commit_info, force, time.monotonic())
+            self._cond.notify()
+            return "queued" if name in self._running else "accepted"
+
+    def project_state(self, name):
+        """Return the scheduler's view of a project for /status."""
+        with self._cond:
+            job = self._queued.get(name)
+            state = {"deploying": name in self._running, "queued": job is not None}
+            if job:
+                state["queued_seconds"] = round(time.monotonic() - job.enqueued_at, 1)
+                if job.commit_info:
+                    state["queued_commit"] = job.commit_info.get("sha", "")
+                if name in self._deferred_reason:
+                    state["queued_reason"] = self._deferred_reason[name]
+            return state
+
+    def is_idle(self):
+        """True while no deploy is running or waiting to start."""
+        with self._cond:
+            return not self._running and not self._queued
+
+    def snapshot(self):
+        """Return queue depth, capacity usage and wait-time stats."""
+        with self._cond:
+            now = time.monotonic()
+            oldest = min((j.enqueued_at for j in self._queued.values()), default=None)
+            return {
+                "concurrency": self.concurrency,
+                "in_use": self._used,
+                "running": sorted(self._running),
+                "queue_depth": len(self._queued),
+                "oldest_wait_seconds": round(now - oldest, 1) if oldest else 0,
+                "avg_wait_seconds": round(self._total_wait / self._started_count, 1)
+                if self._started_count else 0,
+                "max_wait_seconds": round(self._max_wait, 1),
+            }
+
+    def shutdown(self, timeout=None):
+        """Stop starting jobs and wait for the running ones to finish.
+
+        Queued jobs are dropped; their projects are logged and returned.
+
+        Returns:
+            (finished, dropped): whether every running deploy completed within
+            timeout, and the queued jobs that never started, as
+            (project, commit_info, force) tuples in queue order.
+        """
+        with self._cond:
+            self._closing = True
+            jobs = sorted(self._queued.values(), key=lambda j: j.enqueued_at)
+            dropped = [(j.project, j.commit_info, j.force) for j in jobs]
+            self._queued.clear()
+            self._cond.notify_all()
+            if self._running:
+                logger.info("Waiting for running deploys: %s", ", ".join(sorted(self._running)))
+            finished = self._cond.wait_for(lambda: not self._running, timeout)
+            still_running = sorted(self._running)
+        if dropped:
+            logger.warning("Dropped queued deploys on shutdown: %s",
+                           ", ".join(project["name"] for project, _, _ in dropped))
+        if not finished:
+            logger.error("Deploys still running after %ss: %s", timeout, ", ".join(still_running))
+        return finished, dropped
+
+    def _ensure_workers(self):
+        while len(self._workers) < self.concurrency:
+            worker = threading.Thread(
+                target=self._worker_loop,
+                name=f"deploy-worker-{len(self._workers) + 1}",
+                daemon=True,
+            )
+            self._workers.append(worker)
+            worker.start()
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                job = self._pick()
+                while job is None:
+                    self._cond.wait(timeout=_IDLE_POLL if self._queued else None)
+                    job = self._pick()
+                self._start(job)
+
+            try:
+                self._run_job(job.project, job.commit_info, job.force)
+            except Exception:
+                logger.exception("Deploy job for %s crashed", job.name)
+            finally:
+                with self._cond:
+                    del self._running[job.name]
+                    self._used -= min(job.weight, self.concurrency)
+                    self._cond.notify_all()
+
+    def _pick(self):
+        """Return the highest-priority job that may start now (lock held)."""
+        now = time.monotonic()
+        resources = None
+        busy = {j.checkout for j in self._running.values()}
+        self._deferred_reason.clear()
+        for job in sorted(self._queued.values(),
+                          key=lambda j: (-j.priority, j.enqueued_at)):
+            if job.name in self._running:
+                self._deferred_reason[job.name] = "previous deploy running"
+                continue
+            if job.checkout in busy:
+                self._deferred_reason[job.name] = "checkout busy"
+                continue
+            if job.ready_at > now:
+                self._deferred_reason[job.name] = "debounce"
+                continue
+            if self._used + min(job.weight, self.concurrency) > self.concurrency:
+                self._deferred_reason[job.name] = "capacity"
+                continue
+            if job.weight > 1 and now - job.enqueued_at < self._admission_timeout:
+                if resources is None:
+                    resources = self._resource_pressure()
+                if resources:
+                    self._deferred_reason[job.name] = resources
+                    continue
+            return job
+        return None
+
+    def _start(self, job):
+        del self._queued[job.name]
+        self._deferred_reason.pop(job.name, None)
+        job.started_at = time.monotonic()
+        self._running[job.name] = job
+        self._used += min(job.weight, self.concurrency)
+
+        wait = job.started_at - job.enqueued_at
+        self._started_count += 1
+        self._total_wait += wait
+        self._max_wait = max(self._max_wait, wait)
+        logger.info("Starting deploy for %s after %.1fs in queue", job.name, wait)
+
+    def _resource_pressure(self):
+        """Return a reason string if the Pi is too busy for a heavy job, else ""."""
+        if self._max_load is not None:
+            load = os.getloadavg()[0]
+            if load > self._max_load:
+                return f"load average {load:.2f} > {self._max_load}"
+        if self._min_free_mb is not None:
+            free_mb = _mem_available_mb()
+            if free_mb is not None and free_mb < self._min_free_mb:
+                return f"free memory {free_mb}MB < {self._min_free_mb}MB"
+        return ""
+
+
+def _mem_available_mb():
+    """Read MemAvailable from /proc/meminfo (None if unavailable)."""
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) // 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
@@ -31,6 +31,14 @@ case "${DEPLOYER_DEPLOY_MODE}" in
     echo "--- docker compose up -d ---"
     docker compose up -d --build
     ;;
+  docker-image)
+    # Prebuilt images: pull instead of building on the Pi, build only what
+    # the registry does not have
+    echo "--- docker compose pull ---"
+    docker compose pull --ignore-pull-failures
+    echo "--- docker compose up -d ---"
+    docker compose up -d
+    ;;
   systemd)
     SERVICE_NAME="${DEPLOYER_PROJECT_NAME}"
     echo "--- systemctl restart ${SERVICE_NAME} ---"
@@ -0,0 +1,203 @@
+"""Content-hash cache for declared deploy steps.
+
+A project's ``steps`` are commands with input globs (``npm ci`` with
+``package-lock.json``, an asset build with ``src/``). Before a step runs,
+its inputs are hashed together with its command; when the hash equals the
+one recorded after the step's last successful run, the step is skipped.
+
+Tracked inputs are hashed from git's index (``git ls-files -s``: the
+blob ID of every tracked file), so their contents are not read and local
+edits to them are not seen. Untracked files that are not ignored are read
+and hashed, as is every matching file outside a git checkout. A step
+whose globs match no file never hits. The last good hash per
+(project, step) lives in a bounded LRU persisted to a small JSON file.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+
+from pathfilter import matching_paths
+
+logger = logging.getLogger("pi-deployer")
+
+DEFAULT_MAX_ENTRIES = 500
+
+
+_cache = None
+_cache_mutex = threading.Lock()
+
+
+def get_step_cache():
+    """Return the shared cache (STATE_DIR/stepcache.json)."""
+    global _cache
+    path = os.path.join(os.environ.get("STATE_DIR", "./state"), "stepcache.json")
+    with _cache_mutex:
+        if _cache is None or _cache.path != path:
+            max_entries = int(os.environ.get("STEP_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
+            _cache = StepCache(path, max_entries)
+        return _cache
+
+
+class StepCache:
+    """Bounded LRU of (project, step) -> input hash of the last good run.
+
+    Args:
+        path: JSON file the cache is loaded from and saved to, or None to
+            keep it in memory only.
+        max_entries: Keys kept before the least recently used is evicted.
+    """
+
+    def __init__(self, path=None, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max(1, int(max_entries))
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # "project/step" -> {"hash", "time"}
+        self._lock = threading.Lock()
+        if path:
+            self._load()
+
+    def lookup(self, project_name, step_name, digest):
+        """Return True (a hit) if digest matches the step's last good run.
+
+        A digest of None always misses.
+        """
+        key = f"{project_name}/{step_name}"
+        with self._lock:
+            entry = self._entries.get(key)
+            if digest and entry and entry["hash"] == digest:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True
+            self.misses += 1
+            return False
+
+    def store(self, project_name, step_name, digest):
+        """Record digest after the step ran successfully."""
+        key = f"{project_name}/{step_name}"
+        with self._lock:
+            self._entries[key] = {"hash": digest, "time": round(time.time())}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._save()
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+    def _load(self):
+        try:
+            with open(self.path, "r") as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning("Could not read step cache %s: %s", self.path, e)
+            return
+        for key, entry in sorted(entries.items(), key=lambda item: item[1].get("time", 0)):
+            if isinstance(entry, dict) and "hash" in entry:
+                self._entries[key] = entry
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _save(self):
+        if not self.path:
+            return
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(self._entries, f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning("Could not write step cache %s: %s", self.path, e)
+
+
+def hash_inputs(repo_dir, step, env=None, timeout=60):
+    """Hash a step's command and the files matching its ``inputs`` globs.
+
+    Globs follow the include_paths rules (``*`` also matches ``/``, a
+    trailing ``/`` matches a whole directory).
+
+    Returns:
+        (hex digest, number of input files); callers should not trust a
+        digest of zero input files, which only covers the command.
+    """
+    files = _git_index(repo_dir, env, timeout)
+    if files is None:
+        files = _walk(repo_dir)
+    selected = sorted(matching_paths({"include_paths": step["inputs"]}, list(files)))
+
+    digest = hashlib.sha256()
+    digest.update(step["run"].encode())
+    for path in selected:
+        content_id = files[path]
+        if content_id is None:
+            content_id = _file_digest(os.path.join(repo_dir, path))
+        digest.update(f"\0{path}\0{content_id}".encode())
+    return digest.hexdigest(), len(selected)
+
+
+def outputs_present(repo_dir, step):
+    """Whether every declared ``outputs`` path of a step exists."""
+    return all(os.path.exists(os.path.join(repo_dir, p)) for p in step.get("outputs") or [])
+
+
+def _git_index(repo_dir, env, timeout):
+    """Map tracked path -> "mode blob-id" from git's index, or None outside git.
+
+    Untracked, non-ignored files map to None (hashed on demand).
+    """
+    try:
+        result = subprocess.run(
+            ["git", "-C", repo_dir, "ls-files", "-s", "-o", "--exclude-standard", "-z"],
+            capture_output=True, env=env, timeout=timeout,
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    if result.returncode != 0:
+        return None
+    files = {}
+    for record in result.stdout.split(b"\0"):
+        if not record:
+            continue
+        record = record.decode("utf-8", "replace")
+        info, tab, path = record.partition("\t")
+        fields = info.split(" ")
+        if tab and len(fields) == 3:
+            files[path] = f"{fields[0]} {fields[1]}"
+        else:
+            # Untracked files are listed by path only
+            files.setdefault(record, None)
+    return files
+
+
+def _walk(repo_dir):
+    """Map every file below repo_dir (outside .git) to None (hash on demand)."""
+    files = {}
+    for root, dirs, names in os.walk(repo_dir):
+        dirs[:] = [d for d in dirs if d != ".git"]
+        for name in names:
+            path = os.path.relpath(os.path.join(root, name), repo_dir)
+            files[path.replace(os.sep, "/")] = None
+    return files
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 16), b""):
+                digest.update(chunk)
+    except OSError:
+        return "missing"
+    return digest.hexdigest()
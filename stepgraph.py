@@ -0,0 +1,221 @@
+"""Deploy step graphs for pi-deployer.
+
+A deploy is a small DAG of steps. Every deploy mode is a preset graph of
+built-in actions:
+
+    fetch -> update -> <mode action(s)> -> health -> record
+
+(``fetch`` / ``update`` only for git-managed projects, ``health`` only
+when enabled). ``compose_strategy: swap`` splits the compose action into
+``deploy.build`` and ``deploy.pull``, which run at the same time, and
+``deploy.start``; docker-image mode pulls the pushed commit's images
+(``deploy.pull``) while the checkout is fast-forwarded.
+
+A project's ``steps`` add command nodes to the preset. A step without
+``needs`` runs after the previous step (the first one after ``update``),
+so a plain list keeps running in order; ``needs`` lists step or built-in
+names (``deploy`` stands for the mode's action nodes). ``needs: []`` starts
+a step as soon as ``fetch`` decided the deploy goes ahead, alongside
+``update``; ``early: true`` starts it right away instead, even on deploys
+``fetch`` then skips. Each built-in node from the mode action on
+waits for every step that does not itself depend on that node or a later
+one, so e.g. a warm-up step that needs ``deploy`` runs before ``health``.
+
+run_graph executes the nodes on a small thread pool as soon as their
+dependencies succeeded; the first failure stops new nodes from starting
+and cancels the running ones.
+"""
+
+import threading
+
+from compose import IMAGE_MODE
+from gitops import is_git_managed
+
+DEFAULT_PARALLELISM = 4
+
+# Order of the built-in nodes; from _PHASE_DEPLOY on they wait for steps
+_PHASE_FETCH, _PHASE_UPDATE, _PHASE_DEPLOY, _PHASE_HEALTH, _PHASE_RECORD = range(5)
+
+
+def preset_graph(project):
+    """Return the built-in nodes for the project's mode.
+
+    Each node is a dict with "name", "action", "needs" and "phase".
+    """
+    nodes = []
+    mode = project.get("deploy_mode", "pull-only")
+
+    def add(name, action, phase, needs):
+        nodes.append({"name": name, "action": action, "phase": phase, "needs": list(needs)})
+
+    git_managed = is_git_managed(project)
+    if git_managed:
+        add("fetch", "fetch", _PHASE_FETCH, [])
+        add("update", "update", _PHASE_UPDATE, ["fetch"])
+    base = ["update"] if git_managed else []
+
+    if project.get("deploy_script"):
+        add("deploy", "script", _PHASE_DEPLOY, base)
+    elif mode == "docker-compose" and project.get("compose_strategy", "restart") == "swap":
+        add("deploy.build", "compose_build", _PHASE_DEPLOY, base)
+        add("deploy.pull", "compose_pull", _PHASE_DEPLOY, base)
+        add("deploy.start", "compose_start", _PHASE_DEPLOY, ["deploy.build", "deploy.pull"])
+    elif mode == "docker-compose":
+        add("deploy", "compose", _PHASE_DEPLOY, base)
+    elif mode == IMAGE_MODE:
+        # Images of the fetched commit download while the checkout updates
+        add("deploy.pull", "image_pull", _PHASE_UPDATE, ["fetch"] if git_managed else [])
+        add("deploy", "image", _PHASE_DEPLOY, base + ["deploy.pull"])
+    elif mode == "systemd":
+        add("deploy", "systemd", _PHASE_DEPLOY, base)
+
+    previous = [n["name"] for n in nodes if n["phase"] == _PHASE_DEPLOY] or base
+    hc = project.get("health_check", {})
+    if hc.get("enabled") and (hc.get("url") or hc.get("urls")):
+        add("health", "health", _PHASE_HEALTH, list(previous))
+        previous = ["health"]
+    if git_managed:
+        add("record", "record", _PHASE_RECORD, list(previous))
+    return nodes
+
+
+def build_graph(project):
+    """Return the project's full step graph (preset plus declared steps).
+
+    Step nodes are dicts with "name", "run", "needs" and the step's other
+    keys; built-in nodes have "action" instead of "run".
+
+    Raises:
+        ValueError: duplicate or unknown names, or a dependency cycle.
+    """
+    nodes = preset_graph(project)
+    names = {n["name"] for n in nodes}
+    deploy_nodes = [n["name"] for n in nodes if n["phase"] == _PHASE_DEPLOY]
+    anchor = ["update"] if "update" in names else []
+    start = ["fetch"] if "fetch" in names else []
+
+    steps = []
+    previous = anchor
+    for raw in project.get("steps") or []:
+        if not isinstance(raw, dict) or not raw.get("name") or not raw.get("run"):
+            raise ValueError(f"Step needs a name and a run command: {raw!r}")
+        name = raw["name"]
+        if name in names:
+            raise ValueError(f"Duplicate step name: {name}")
+        names.add(name)
+        needs = raw.get("needs")
+        if needs is None:
+            needs = [] if raw.get("early") else previous
+        elif isinstance(needs, str):
+            needs = [needs]
+        step = {**raw, "needs": []}
+        for need in needs:
+            if need == "deploy" and "deploy" not in {n["name"] for n in nodes}:
+                step["needs"] += deploy_nodes or anchor
+            else:
+                step["needs"].append(need)
+        steps.append(step)
+        previous = [name]
+
+    for step in steps:
+        unknown = [n for n in step["needs"] if n not in names]
+        if unknown:
+            raise ValueError(f"Step {step['name']} needs unknown step(s): {', '.join(unknown)}")
+
+    graph = {n["name"]: n for n in nodes + steps}
+    for step in steps:
+        # A deploy that fetch skips (already deployed, no matching paths)
+        # runs no step unless the step opted in with early
+        if start and not step.get("early") and not _depends_on(graph, step, set(start)):
+            step["needs"] += start
+    for node in nodes:
+        if node["phase"] < _PHASE_DEPLOY:
+            continue
+        later = {n["name"] for n in nodes if n["phase"] >= node["phase"]}
+        for step in steps:
+            if step["name"] not in node["needs"] and not _depends_on(graph, step, later):
+                node["needs"].append(step["name"])
+    _check_acyclic(graph)
+    return nodes + steps
+
+
+def run_graph(nodes, run_node, cancel=None, max_parallel=DEFAULT_PARALLELISM):
+    """Run nodes in dependency order, independent ones in parallel.
+
+    Args:
+        nodes: Node dicts with "name" and "needs" (from build_graph).
+        run_node: Callable(node) executing one node; raising fails it.
+        cancel: Callable run once when the first node fails, to stop the
+            ones still running (e.g. CancelToken.cancel).
+        max_parallel: Nodes running at the same time.
+
+    Raises:
+        The first node's exception, after every running node returned.
+    """
+    pending = {n["name"]: n for n in nodes}
+    done = set()
+    running = set()
+    failure = []
+    cond = threading.Condition()
+
+    def worker(node):
+        try:
+            run_node(node)
+        except BaseException as e:
+            with cond:
+                first = not failure
+                failure.append(e)
+            if first and cancel:
+                cancel()
+        with cond:
+            running.discard(node["name"])
+            if not failure:
+                done.add(node["name"])
+            cond.notify_all()
+
+    with cond:
+        while True:
+            if not failure:
+                ready = [n for n in pending.values() if done.issuperset(n["needs"])]
+                for node in ready[:max(1, max_parallel) - len(running)]:
+                    del pending[node["name"]]
+                    running.add(node["name"])
+                    threading.Thread(target=worker, args=(node,), daemon=True,
+                                     name=f"step-{node['name']}").start()
+            if not running:
+                break
+            cond.wait()
+    if failure:
+        raise failure[0]
+    if pending:
+        raise RuntimeError(f"Steps never became ready: {', '.join(pending)}")
+
+
+def _depends_on(graph, node, targets, seen=None):
+    """Whether node (transitively) needs any of targets."""
+    seen = set() if seen is None else seen
+    for need in node["needs"]:
+        if need in targets:
+            return True
+        if need not in seen:
+            seen.add(need)
+            if _depends_on(graph, graph[need], targets, seen):
+                return True
+    return False
+
+
+def _check_acyclic(graph):
+    state = {}  # name -> 1 while visiting, 2 when done
+
+    def visit(name, path):
+        if state.get(name) == 2:
+            return
+        if state.get(name) == 1:
+            raise ValueError(f"Step dependency cycle: {' -> '.join(path + [name])}")
+        state[name] = 1
+        for need in graph[name]["needs"]:
+            visit(need, path + [name])
+        state[name] = 2
+
+    for name in graph:
+        visit(name, [])
@@ -1,8 +1,12 @@
 """Signature and token verification for pi-deployer."""
 
+import functools
 import hashlib
 import hmac
 
+# "sha256=" followed by 64 hex characters
+SIGNATURE_HEADER_LENGTH = 7 + 64
+
 
 def verify_signature(payload_body, signature_header, secret):
     """Verify GitHub webhook HMAC-SHA256 signature.
@@ -15,22 +19,32 @@ def verify_signature(payload_body, signature_header, secret):
     Returns:
         True if signature is valid, False otherwise.
     """
-    if not signature_header or not secret:
-        return False
-
-    if not signature_header.startswith("sha256="):
+    if not secret or not is_signature_header(signature_header):
         return False
 
-    expected = hmac.new(
-        secret.encode("utf-8"),
-        payload_body,
-        hashlib.sha256,
-    ).hexdigest()
+    mac = _hmac_template(secret).copy()
+    mac.update(payload_body)
+    expected = mac.hexdigest()
 
     received = signature_header[7:]  # strip "sha256="
     return hmac.compare_digest(expected, received)
 
 
+def is_signature_header(signature_header):
+    """Cheap syntactic check of X-Hub-Signature-256, before reading the body."""
+    return (
+        bool(signature_header)
+        and len(signature_header) == SIGNATURE_HEADER_LENGTH
+        and signature_header.startswith("sha256=")
+    )
+
+
+@functools.lru_cache(maxsize=64)
+def _hmac_template(secret):
+    """HMAC object keyed with secret; copying it skips re-deriving the key pads."""
+    return hmac.new(secret.encode("utf-8"), digestmod=hashlib.sha256)
+
+
 def verify_bearer_token(auth_header, token):
     """Verify Bearer token from Authorization header.
 
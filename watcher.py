@@ -0,0 +1,127 @@
+"""Watch projects.yml and reload it when it changes.
+
+Uses Linux inotify (through ctypes, no extra package) on the file's
+directory, so edits that replace the file via rename are seen too. Falls
+back to polling the file's mtime/size/inode where inotify is unavailable.
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import threading
+
+logger = logging.getLogger("pi-deployer")
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_CLOEXEC = 0o2000000
+_WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MODIFY
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+DEFAULT_DEBOUNCE = 0.5
+DEFAULT_POLL_INTERVAL = 2.0
+
+
+class ConfigWatcher:
+    """Calls on_change() once a watched file has settled after a change.
+
+    Args:
+        path: File to watch.
+        on_change: Callable run on the watcher thread after each change.
+        debounce: Quiet period (seconds) after the last event before reloading,
+            so a burst of writes from an editor causes one reload.
+        poll_interval: Check interval of the polling fallback.
+    """
+
+    def __init__(self, path, on_change, debounce=DEFAULT_DEBOUNCE,
+                 poll_interval=DEFAULT_POLL_INTERVAL):
+        self.path = os.path.abspath(path)
+        self._on_change = on_change
+        self._debounce = debounce
+        self._poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._thread = None
+        self.mode = None
+
+    def start(self):
+        fd = _inotify_watch(os.path.dirname(self.path))
+        self.mode = "inotify" if fd is not None else "poll"
+        target = (lambda: self._inotify_loop(fd)) if fd is not None else self._poll_loop
+        self._thread = threading.Thread(target=target, name="config-watcher", daemon=True)
+        self._thread.start()
+        logger.info("Watching %s for changes (%s)", self.path, self.mode)
+
+    def stop(self):
+        self._stop.set()
+
+    def _inotify_loop(self, fd):
+        name = os.path.basename(self.path).encode()
+        try:
+            while not self._stop.is_set():
+                if not select.select([fd], [], [], 1.0)[0]:
+                    continue
+                if not _events_for(os.read(fd, 4096), name):
+                    continue
+                # Swallow the rest of the burst, then reload once
+                while select.select([fd], [], [], self._debounce)[0]:
+                    os.read(fd, 4096)
+                self._fire()
+        finally:
+            os.close(fd)
+
+    def _poll_loop(self):
+        last = _stat_key(self.path)
+        while not self._stop.wait(self._poll_interval):
+            current = _stat_key(self.path)
+            if current != last:
+                self._stop.wait(self._debounce)
+                last = _stat_key(self.path)
+                self._fire()
+
+    def _fire(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            self._on_change()
+        except Exception:
+            logger.exception("Config reload after file change failed")
+
+
+def _inotify_watch(directory):
+    """Return an inotify fd watching directory, or None if unsupported."""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(IN_CLOEXEC)
+        if fd < 0:
+            return None
+        if libc.inotify_add_watch(fd, os.fsencode(directory), _WATCH_MASK) < 0:
+            os.close(fd)
+            return None
+        return fd
+    except (OSError, AttributeError):
+        return None
+
+
+def _events_for(buf, name):
+    """True if the inotify event buffer mentions the file name."""
+    offset = 0
+    while offset + _EVENT_HEADER.size <= len(buf):
+        _, _, _, length = _EVENT_HEADER.unpack_from(buf, offset)
+        offset += _EVENT_HEADER.size
+        if buf[offset:offset + length].rstrip(b"\0") == name:
+            return True
+        offset += length
+    return False
+
+
+def _stat_key(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)